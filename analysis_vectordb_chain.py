@@ -6,6 +6,7 @@
 使用管道操作符: analyze_pr | save_to_vector_store
 支持多种框架: langchain, anthropic
 """
+
 import os
 import asyncio
 import argparse
@@ -15,7 +16,7 @@ from typing import Dict, Optional, Literal, List
 from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 
 from pr_analysis_langchain import PRAnalysisLangChain
-from pr_analysis_anthropic import PRAnalysisAnthropic
+from pr_analysis_anthropic import PRAnalysisAnthropic, close_async_anthropic_client
 from vector_store import VectorStoreManager
 from database import DatabaseManager
 from logger_config import setup_logger
@@ -90,11 +91,7 @@ class PRAnalysisRunnable:
         logger.info(f"   工具调用: {'启用' if self.enable_tools else '禁用'}")
 
         # 对于异步的 analyzer，需要在事件循环中运行
-        result = asyncio.run(
-            self.analyzer.analyze_pr(
-                pr_number=pr_number, enable_tools=self.enable_tools
-            )
-        )
+        result = asyncio.run(self._analyze_pr_async(pr_number))
 
         if result.get("success"):
             logger.info(f"✅ PR 分析完成")
@@ -104,6 +101,16 @@ class PRAnalysisRunnable:
         result["skipped"] = False
         return result
 
+    async def _analyze_pr_async(self, pr_number: Optional[int]) -> Dict:
+        """在本次 asyncio.run 的事件循环中分析 PR，结束前关闭该循环中的异步客户端"""
+        try:
+            return await self.analyzer.analyze_pr(
+                pr_number=pr_number, enable_tools=self.enable_tools
+            )
+        finally:
+            if self.framework == "anthropic":
+                await close_async_anthropic_client()
+
     def close(self):
         """关闭资源"""
         if self.analyzer:
@@ -189,6 +196,7 @@ def create_pr_analysis_chain(
     enable_tools: bool = True,
     save_to_vector: bool = True,
     check_exists: bool = True,
+    vector_store: Optional[VectorStoreManager] = None,
 ):
     """
     创建 PR 分析 Chain（使用 LangChain LCEL 语法）
@@ -198,6 +206,7 @@ def create_pr_analysis_chain(
         enable_tools: 是否启用工具调用（read, glob, grep）
         save_to_vector: 是否保存到向量数据库
         check_exists: 是否在分析前检查 PR 是否已存在于向量数据库
+        vector_store: 已初始化的向量数据库（可选，不提供时按需创建）
 
     Returns:
         LangChain Runnable Chain
@@ -218,8 +227,7 @@ def create_pr_analysis_chain(
     logger.info(f"   检查存在: {'启用' if check_exists else '禁用'}")
 
     # 统一初始化向量数据库（如果需要）
-    vector_store = None
-    if save_to_vector or check_exists:
+    if vector_store is None and (save_to_vector or check_exists):
         logger.info("🔧 初始化向量数据库...")
         try:
             vector_store = VectorStoreManager()
@@ -381,12 +389,26 @@ def batch_analyze_prs(
         "skipped_prs": [],
     }
 
+    # 一次查询找出已在向量数据库中的 PR，不再逐个检查
+    vector_store = None
+    existing = set()
+    if save_to_vector or check_exists:
+        try:
+            vector_store = VectorStoreManager()
+            if check_exists:
+                existing = vector_store.existing_pr_numbers(pr_numbers)
+                logger.info(f"📊 {len(existing)} 个 PR 已存在于向量数据库")
+        except Exception as e:
+            logger.error(f"⚠️ 向量数据库初始化失败: {e}")
+            vector_store = None
+
     # 创建一个 Chain 对象
     chain = create_pr_analysis_chain(
         framework=framework,
         enable_tools=enable_tools,
         save_to_vector=save_to_vector,
-        check_exists=check_exists,
+        check_exists=check_exists and vector_store is None,
+        vector_store=vector_store,
     )
 
     for i, pr_number in enumerate(pr_numbers, 1):
@@ -394,6 +416,12 @@ def batch_analyze_prs(
         logger.info(f"进度: {i}/{len(pr_numbers)} - PR #{pr_number}")
         logger.info(f"{'='*80}")
 
+        if pr_number in existing:
+            results["skipped"] += 1
+            results["skipped_prs"].append(pr_number)
+            logger.info(f"⏭️ PR #{pr_number} 已存在于向量数据库，跳过")
+            continue
+
         try:
             # 使用复用的 chain 对象
             result = chain.invoke({"pr_number": pr_number})
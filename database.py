@@ -1,12 +1,28 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, PoolError
+from mysql.connector import pooling
+import hashlib
 import os
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from config import DEFAULT_DB_CONFIG
 from logger_config import setup_logger
 
 logger = setup_logger(__name__)
 
+# 通过 acquire() 并发查询的线程数（如 pr_analysis_common 中的评论查询线程池）
+DB_EXECUTOR_WORKERS = 4
+# 连接池大小（mysql-connector 上限为 32，创建时即建立全部连接）：
+# 固定的 self.connection + 每个并发查询线程一个 + 调用线程自身的 acquire()
+DB_POOL_SIZE = DB_EXECUTOR_WORKERS + 2
+# 连接池耗尽时 acquire() 等待空闲连接的最长秒数
+DB_ACQUIRE_TIMEOUT = 30
+# executemany 每组写入的行数
+DB_BATCH_SIZE = 500
+# 多行 INSERT 中大字段（diff）的累计字符数上限
+DB_BATCH_MAX_CHARS = 8 * 1024 * 1024
+
 
 def convert_iso_to_mysql_datetime(iso_datetime):
     """
@@ -16,6 +32,25 @@ def convert_iso_to_mysql_datetime(iso_datetime):
     if not iso_datetime:
         return None
 
+    # 快速路径：GitHub 的固定格式（如 "2025-03-18T01:57:54Z"）校验日期合法后直接按位置截取，
+    # 省去时区处理和 strftime；非法日期（如 2025-02-30）与完整解析一样返回 None
+    s = iso_datetime
+    if (
+        isinstance(s, str)
+        and len(s) == 20
+        and s[4] == "-"
+        and s[7] == "-"
+        and s[10] == "T"
+        and s[13] == ":"
+        and s[16] == ":"
+        and s[19] == "Z"
+    ):
+        try:
+            datetime.fromisoformat(s[:19])
+        except ValueError:
+            return None
+        return f"{s[:10]} {s[11:19]}"
+
     try:
         # Parse ISO 8601 format and format as MySQL datetime
         dt = datetime.fromisoformat(iso_datetime.replace("Z", "+00:00"))
@@ -26,19 +61,25 @@ def convert_iso_to_mysql_datetime(iso_datetime):
 
 class DatabaseManager:
     def __init__(self):
+        self.pool = None
         self.connection = None
         self.connect()
         self.create_tables()
 
     def connect(self):
         try:
-            self.connection = mysql.connector.connect(
+            self.pool = pooling.MySQLConnectionPool(
+                pool_name="pr_pool",
+                pool_size=DB_POOL_SIZE,
+                pool_reset_session=False,
                 host=DEFAULT_DB_CONFIG["host"],
                 user=DEFAULT_DB_CONFIG["user"],
                 password=DEFAULT_DB_CONFIG["password"],
                 database=DEFAULT_DB_CONFIG["database"],
                 autocommit=True,
             )
+            # 常规的顺序操作使用固定的一个连接，并发查询通过 acquire() 从池中获取
+            self.connection = self.pool.get_connection()
             if self.connection.is_connected():
                 logger.info(
                     f"Connected to MySQL database: {DEFAULT_DB_CONFIG['database']}"
@@ -77,6 +118,7 @@ class DatabaseManager:
             created_at DATETIME,
             updated_at DATETIME,
             html_url VARCHAR(1000),
+            INDEX idx_pr_created (pr_number, created_at),
             FOREIGN KEY (pr_number) REFERENCES iotdb_prs(number) ON DELETE CASCADE
         )
         """
@@ -99,6 +141,32 @@ class DatabaseManager:
             id INT AUTO_INCREMENT PRIMARY KEY,
             pr_number INT,
             diff_content LONGTEXT,
+            diff_sha1 CHAR(40),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_pr_created (pr_number, created_at),
+            FOREIGN KEY (pr_number) REFERENCES iotdb_prs(number) ON DELETE CASCADE
+        )
+        """
+
+        # 按内容 SHA-1 去重存储 diff，pr_diffs 只保存哈希引用
+        # （旧数据的内容仍直接保存在 pr_diffs.diff_content 中）
+        create_diff_contents_table = """
+        CREATE TABLE IF NOT EXISTS pr_diff_contents (
+            sha1 CHAR(40) PRIMARY KEY,
+            diff_content LONGTEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+
+        create_analysis_cache_table = """
+        CREATE TABLE IF NOT EXISTS pr_analysis_cache (
+            pr_hash CHAR(64) PRIMARY KEY,
+            pr_number INT,
+            model VARCHAR(100),
+            temperature FLOAT,
+            analysis LONGTEXT,
+            usage_info JSON,
+            enable_tools BOOLEAN,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (pr_number) REFERENCES iotdb_prs(number) ON DELETE CASCADE
         )
@@ -110,12 +178,67 @@ class DatabaseManager:
             cursor.execute(create_comments_table)
             cursor.execute(create_images_table)
             cursor.execute(create_diffs_table)
+            cursor.execute(create_diff_contents_table)
+            cursor.execute(create_analysis_cache_table)
+            # 旧版本创建的表没有这些列和索引，按需补建
+            self._ensure_column(cursor, "pr_diffs", "diff_sha1", "CHAR(40)")
+            self._ensure_column(cursor, "pr_analysis_cache", "enable_tools", "BOOLEAN")
+            self._ensure_index(
+                cursor, "pr_diffs", "idx_pr_created", "pr_number, created_at"
+            )
+            self._ensure_index(
+                cursor, "pr_comments", "idx_pr_created", "pr_number, created_at"
+            )
             logger.info("Tables created successfully")
         except Error as e:
             logger.error(f"Error creating tables: {e}")
         finally:
             cursor.close()
 
+    def _ensure_column(self, cursor, table, column, definition):
+        """
+        列不存在时为表添加列（MySQL 不支持 ADD COLUMN IF NOT EXISTS）
+
+        Args:
+            cursor: 数据库游标
+            table: 表名
+            column: 列名
+            definition: 列定义
+        """
+        cursor.execute(
+            """
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+            LIMIT 1
+            """,
+            (table, column),
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"Added column {column} to {table}")
+
+    def _ensure_index(self, cursor, table, index_name, columns):
+        """
+        索引不存在时为表添加索引（MySQL 不支持 ADD INDEX IF NOT EXISTS）
+
+        Args:
+            cursor: 数据库游标
+            table: 表名
+            index_name: 索引名
+            columns: 索引列（逗号分隔）
+        """
+        cursor.execute(
+            """
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            LIMIT 1
+            """,
+            (table, index_name),
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE {table} ADD INDEX {index_name} ({columns})")
+            logger.info(f"Added index {index_name} on {table}({columns})")
+
     def insert_pr(self, pr_data):
         query = """
         INSERT INTO iotdb_prs (number, title, body, created_at, merged_at, user, labels, head, base, diff_url, comments_url, additions, deletions, merge_commit)
@@ -212,23 +335,18 @@ class DatabaseManager:
             cursor.close()
 
     def insert_diff(self, diff_data):
-        query = """
-        INSERT INTO pr_diffs (pr_number, diff_content)
-        VALUES (%s, %s)
-        """
+        diff_content = diff_data["diff_content"]
+        sha1 = self.diff_sha1(diff_content)
 
         try:
             cursor = self.connection.cursor()
-            cursor.execute(
-                query,
-                (
-                    diff_data["pr_number"],
-                    diff_data["diff_content"],
-                ),
-            )
+            self.connection.start_transaction()
+            cursor.execute(self._DIFF_CONTENT_INSERT, (sha1, diff_content))
+            cursor.execute(self._DIFF_INSERT, (diff_data["pr_number"], sha1))
             self.connection.commit()
             return True
         except Error as e:
+            self.connection.rollback()
             logger.error(f"Error inserting diff: {e}")
             return False
         finally:
@@ -251,81 +369,173 @@ class DatabaseManager:
         finally:
             cursor.close()
 
-    def insert_pr_diff_comments(self, pr_data, diff_content=None, comments_list=None):
-        """在一个事务中处理PR、diff和comments"""
-        cursor = self.connection.cursor()
+    def existing_pr_numbers(self, pr_numbers):
+        """
+        批量检查PR是否已存在，每 DB_BATCH_SIZE 个编号一次查询
+
+        Args:
+            pr_numbers: PR 编号列表
+
+        Returns:
+            数据库中已存在的 PR 编号集合
+        """
+        pr_numbers = list(pr_numbers)
+        existing = set()
         try:
-            # 调试信息：检查连接状态
-            logger.debug(
-                f"开始处理PR #{pr_data['number']}: autocommit={self.connection.autocommit}, in_transaction={self.connection.in_transaction}"
-            )
+            cursor = self.connection.cursor()
+            for start in range(0, len(pr_numbers), DB_BATCH_SIZE):
+                batch = pr_numbers[start : start + DB_BATCH_SIZE]
+                placeholders = ", ".join(["%s"] * len(batch))
+                cursor.execute(
+                    f"SELECT number FROM iotdb_prs WHERE number IN ({placeholders})",
+                    batch,
+                )
+                existing.update(row[0] for row in cursor.fetchall())
+            return existing
+        except Error as e:
+            logger.error(f"Error checking PR existence: {e}")
+            return existing
+        finally:
+            cursor.close()
 
-            self.connection.start_transaction()
+    @staticmethod
+    def _pr_row(pr_data):
+        """iotdb_prs 表的一行参数"""
+        return (
+            pr_data["number"],
+            pr_data["title"],
+            pr_data["body"],
+            convert_iso_to_mysql_datetime(pr_data["created_at"]),
+            convert_iso_to_mysql_datetime(pr_data["merged_at"]),
+            pr_data["user"],
+            pr_data["labels"],
+            pr_data["head"],
+            pr_data["base"],
+            pr_data["diff_url"],
+            pr_data["comments_url"],
+            pr_data["additions"],
+            pr_data["deletions"],
+            pr_data.get("merge_commit"),
+        )
 
-            # 插入PR
-            pr_insert = """
-            INSERT INTO iotdb_prs (number, title, body, created_at, merged_at, user, labels, head, base, diff_url, comments_url, additions, deletions, merge_commit)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(
-                pr_insert,
+    @staticmethod
+    def _comment_rows(pr_number, comments_list):
+        """pr_comments 表的多行参数（过滤掉 bot 评论）"""
+        rows = []
+        for comment in comments_list or []:
+            # 过滤掉包含 [bot] 的作者
+            if "[bot]" in comment.get("user", "").lower():
+                logger.info(f"跳过bot评论: {comment.get('user', '')}")
+                continue
+
+            rows.append(
                 (
-                    pr_data["number"],
-                    pr_data["title"],
-                    pr_data["body"],
-                    convert_iso_to_mysql_datetime(pr_data["created_at"]),
-                    convert_iso_to_mysql_datetime(pr_data["merged_at"]),
-                    pr_data["user"],
-                    pr_data["labels"],
-                    pr_data["head"],
-                    pr_data["base"],
-                    pr_data["diff_url"],
-                    pr_data["comments_url"],
-                    pr_data["additions"],
-                    pr_data["deletions"],
-                    pr_data.get("merge_commit"),
-                ),
+                    comment["id"],
+                    pr_number,
+                    comment["user"],
+                    comment["body"],
+                    convert_iso_to_mysql_datetime(comment["created_at"]),
+                    convert_iso_to_mysql_datetime(comment["updated_at"]),
+                    comment["html_url"],
+                )
             )
+        return rows
 
-            # 插入diff
-            if diff_content:
-                diff_insert = (
-                    "INSERT INTO pr_diffs (pr_number, diff_content) VALUES (%s, %s)"
-                )
-                cursor.execute(diff_insert, (pr_data["number"], diff_content))
-
-            # 插入comments（过滤掉 bot）
-            if comments_list:
-                comment_insert = """
-                INSERT INTO pr_comments (id, pr_number, user, body, created_at, updated_at, html_url)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """
-                for comment in comments_list:
-                    # 过滤掉包含 [bot] 的作者
-                    if "[bot]" in comment.get("user", "").lower():
-                        logger.info(f"跳过bot评论: {comment.get('user', '')}")
-                        continue
-
-                    cursor.execute(
-                        comment_insert,
-                        (
-                            comment["id"],
-                            pr_data["number"],
-                            comment["user"],
-                            comment["body"],
-                            convert_iso_to_mysql_datetime(comment["created_at"]),
-                            convert_iso_to_mysql_datetime(comment["updated_at"]),
-                            comment["html_url"],
-                        ),
-                    )
+    _PR_INSERT = """
+    INSERT INTO iotdb_prs (number, title, body, created_at, merged_at, user, labels, head, base, diff_url, comments_url, additions, deletions, merge_commit)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    _DIFF_INSERT = "INSERT INTO pr_diffs (pr_number, diff_sha1) VALUES (%s, %s)"
+    # 相同内容的 diff 只保存一份
+    _DIFF_CONTENT_INSERT = """
+    INSERT INTO pr_diff_contents (sha1, diff_content) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE sha1 = sha1
+    """
+    _COMMENT_INSERT = """
+    INSERT INTO pr_comments (id, pr_number, user, body, created_at, updated_at, html_url)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
 
-            self.connection.commit()
+    @staticmethod
+    def diff_sha1(diff_content):
+        """diff 内容的 SHA-1，作为 pr_diff_contents 的去重键"""
+        return hashlib.sha1(diff_content.encode("utf-8")).hexdigest()
+
+    def _executemany_in_batches(self, cursor, query, rows):
+        """分组执行 executemany，避免单条多行语句超过 max_allowed_packet"""
+        for start in range(0, len(rows), DB_BATCH_SIZE):
+            cursor.executemany(query, rows[start : start + DB_BATCH_SIZE])
+
+    def insert_pr_diff_comments(self, pr_data, diff_content=None, comments_list=None):
+        """在一个事务中处理PR、diff和comments"""
+        return self.insert_prs_bulk([(pr_data, diff_content, comments_list)])
+
+    def insert_prs_bulk(self, records):
+        """
+        在一个事务中批量插入多个PR及其diff和comments
+
+        每张表使用 executemany 生成多行 INSERT，网络往返次数与PR数量无关
+
+        Args:
+            records: (pr_data, diff_content, comments_list) 元组列表
+
+        Returns:
+            全部插入成功返回 True，失败时整体回滚并返回 False
+        """
+        if not records:
             return True
 
+        pr_rows = []
+        diff_rows = []
+        diff_contents = {}
+        comment_rows = []
+        for pr_data, diff_content, comments_list in records:
+            pr_rows.append(self._pr_row(pr_data))
+            if diff_content:
+                sha1 = self.diff_sha1(diff_content)
+                diff_contents[sha1] = diff_content
+                diff_rows.append((pr_data["number"], sha1))
+            comment_rows.extend(self._comment_rows(pr_data["number"], comments_list))
+
+        # 写事务从连接池单独获取连接，不与其他线程共用 self.connection
+        try:
+            with self.acquire() as conn:
+                self._write_bulk(conn, pr_rows, diff_contents, diff_rows, comment_rows)
+            return True
         except Error as e:
-            self.connection.rollback()
             logger.error(f"事务失败，已回滚: {e}")
             return False
+
+    def _write_bulk(self, conn, pr_rows, diff_contents, diff_rows, comment_rows):
+        """在 conn 上以一个事务写入 insert_prs_bulk 整理好的各表数据，失败时回滚"""
+        cursor = conn.cursor()
+        try:
+            # 调试信息：检查连接状态
+            logger.debug(
+                f"开始批量处理 {len(pr_rows)} 个PR: autocommit={conn.autocommit}, in_transaction={conn.in_transaction}"
+            )
+
+            conn.start_transaction()
+            self._executemany_in_batches(cursor, self._PR_INSERT, pr_rows)
+            # diff 内容较大，按累计字符数分组，避免超过 max_allowed_packet
+            batch = []
+            batch_chars = 0
+            for content_row in diff_contents.items():
+                if batch and batch_chars + len(content_row[1]) > DB_BATCH_MAX_CHARS:
+                    cursor.executemany(self._DIFF_CONTENT_INSERT, batch)
+                    batch = []
+                    batch_chars = 0
+                batch.append(content_row)
+                batch_chars += len(content_row[1])
+            if batch:
+                cursor.executemany(self._DIFF_CONTENT_INSERT, batch)
+            self._executemany_in_batches(cursor, self._DIFF_INSERT, diff_rows)
+            self._executemany_in_batches(cursor, self._COMMENT_INSERT, comment_rows)
+            conn.commit()
+        except Error:
+            # 连接归还到池中前必须结束未提交的事务
+            conn.rollback()
+            raise
         finally:
             cursor.close()
 
@@ -371,6 +581,174 @@ class DatabaseManager:
         finally:
             cursor.close()
 
+    def get_unanalyzed_pr_numbers(self, limit, enable_tools):
+        """
+        获取尚未保存指定类型分析结果的 PR 编号列表
+
+        Args:
+            limit: 最多返回的 PR 数量
+            enable_tools: 只把启用（True）或不启用（False）工具的分析结果视为已分析
+
+        Returns:
+            PR 编号列表，按 merged_at 降序排列
+        """
+        query = """
+        SELECT p.number FROM iotdb_prs p
+        WHERE NOT EXISTS (
+            SELECT 1 FROM pr_analysis_cache c
+            WHERE c.pr_number = p.number AND c.enable_tools = %s
+        )
+        ORDER BY p.merged_at DESC
+        LIMIT %s
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(query, (enable_tools, limit))
+            results = cursor.fetchall()
+            return [row[0] for row in results]
+        except Error as e:
+            logger.error(f"查询待分析PR失败: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def get_cached_analysis(self, pr_hash):
+        """
+        根据缓存键获取已保存的PR分析结果
+
+        Args:
+            pr_hash: 分析缓存键（SHA-256）
+
+        Returns:
+            包含 analysis 和 usage_info 的字典，不存在时返回 None
+        """
+        query = """
+        SELECT pr_number, model, temperature, analysis, usage_info, created_at
+        FROM pr_analysis_cache
+        WHERE pr_hash = %s
+        """
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+            cursor.execute(query, (pr_hash,))
+            return cursor.fetchone()
+        except Error as e:
+            logger.error(f"查询分析缓存失败: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def save_cached_analysis(
+        self,
+        pr_hash,
+        pr_number,
+        model,
+        temperature,
+        analysis,
+        usage_info,
+        enable_tools,
+    ):
+        """
+        保存PR分析结果到缓存表（已存在则覆盖）
+
+        Args:
+            pr_hash: 分析缓存键（SHA-256）
+            pr_number: PR编号
+            model: 模型名称
+            temperature: 温度参数
+            analysis: 分析结果文本
+            usage_info: token 使用统计（JSON 字符串）
+            enable_tools: 分析时是否启用了工具调用
+        """
+        query = """
+        REPLACE INTO pr_analysis_cache (pr_hash, pr_number, model, temperature, analysis, usage_info, enable_tools)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(
+                query,
+                (
+                    pr_hash,
+                    pr_number,
+                    model,
+                    temperature,
+                    analysis,
+                    usage_info,
+                    enable_tools,
+                ),
+            )
+            self.connection.commit()
+            return True
+        except Error as e:
+            logger.error(f"保存分析缓存失败: {e}")
+            return False
+        finally:
+            cursor.close()
+
+    def save_cached_analyses(self, rows):
+        """
+        批量保存PR分析结果到缓存表（已存在则覆盖），用于批处理回填
+
+        Args:
+            rows: (pr_hash, pr_number, model, temperature, analysis, usage_info,
+                  enable_tools) 元组列表
+        """
+        if not rows:
+            return True
+
+        query = """
+        REPLACE INTO pr_analysis_cache (pr_hash, pr_number, model, temperature, analysis, usage_info, enable_tools)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        try:
+            cursor = self.connection.cursor()
+            # 分组写入，避免单条多行语句超过 max_allowed_packet
+            for start in range(0, len(rows), DB_BATCH_SIZE):
+                cursor.executemany(query, rows[start : start + DB_BATCH_SIZE])
+            self.connection.commit()
+            return True
+        except Error as e:
+            logger.error(f"批量保存分析缓存失败: {e}")
+            return False
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def acquire(self):
+        """
+        从连接池获取一个连接，退出上下文时归还
+
+        用法:
+            with db.acquire() as conn:
+                cursor = conn.cursor()
+        """
+        deadline = time.monotonic() + DB_ACQUIRE_TIMEOUT
+        while True:
+            try:
+                conn = self.pool.get_connection()
+                break
+            except PoolError:
+                # 连接池暂时耗尽时等待其他线程归还连接，而不是直接失败
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
     def close(self):
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
+        """归还固定连接并关闭连接池中的全部连接"""
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Error as e:
+                logger.warning(f"Error returning connection to pool: {e}")
+            self.connection = None
+        if self.pool is not None:
+            try:
+                # mysql-connector 没有公开的关闭连接池接口
+                self.pool._remove_connections()
+            except Error as e:
+                logger.warning(f"Error closing connection pool: {e}")
+            self.pool = None
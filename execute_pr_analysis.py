@@ -11,7 +11,11 @@ import sys
 from typing import Dict, Optional
 
 from pr_analysis_langchain import PRAnalysisLangChain
-from pr_analysis_anthropic import PRAnalysisAnthropic
+from pr_analysis_anthropic import (
+    PRAnalysisAnthropic,
+    close_async_anthropic_client,
+    install_event_loop,
+)
 from logger_config import setup_logger
 
 logger = setup_logger(__name__)
@@ -81,6 +85,7 @@ async def analyze_with_anthropic(
         return result
     finally:
         analyzer.close()
+        await close_async_anthropic_client()
 
 
 async def main():
@@ -182,4 +187,5 @@ async def main():
 
 
 if __name__ == "__main__":
+    install_event_loop()
     sys.exit(asyncio.run(main()))
@@ -1,5 +1,8 @@
+import aiohttp
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 from datetime import datetime, timedelta
 import re
 from urllib.parse import urlparse
@@ -8,6 +11,63 @@ from logger_config import setup_logger
 
 logger = setup_logger(__name__)
 
+# Keep-alive pool shared by every request made through one GitHubClient
+HTTP_POOL_SIZE = 32
+HTTP_MAX_RETRIES = 5
+
+# GitHub GraphQL API endpoint
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# GraphQL query using search API with all required fields for process_pr
+SEARCH_PRS_QUERY = """
+query($searchQuery: String!, $cursor: String) {
+  search(query: $searchQuery, type: ISSUE, first: 100, after: $cursor) {
+    issueCount
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    nodes {
+      ... on PullRequest {
+        number
+        title
+        body
+        createdAt
+        mergedAt
+        author {
+          login
+        }
+        labels(first: 50) {
+          nodes {
+            name
+          }
+        }
+        comments(first: 100) {
+          nodes {
+            databaseId
+            author {
+              login
+              __typename
+            }
+            body
+            createdAt
+            updatedAt
+            url
+          }
+        }
+        headRefName
+        baseRefName
+        additions
+        deletions
+        mergeCommit {
+          oid
+        }
+      }
+    }
+  }
+}
+"""
+
 
 class GitHubClient:
     def __init__(self, token):
@@ -17,6 +77,35 @@ class GitHubClient:
             "Authorization": f"token {token}",
             "Accept": "application/vnd.github.v3+json",
         }
+        # GraphQL request bodies are serialized with orjson and sent as raw bytes
+        self.json_headers = {**self.headers, "Content-Type": "application/json"}
+        self.session = self._create_session()
+
+    @staticmethod
+    def _create_session():
+        """
+        Create a pooled session so TCP/TLS connections are reused across PRs
+        """
+        session = requests.Session()
+        retry = Retry(
+            total=HTTP_MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+        )
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE,
+            pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=retry,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        """
+        Close the underlying HTTP session
+        """
+        self.session.close()
 
     def _transform_pr_data(self, pr_node, owner="apache", repo="iotdb"):
         """
@@ -71,16 +160,10 @@ class GitHubClient:
 
         return pr
 
-    def get_iotdb_prs(
-        self, owner="apache", repo="iotdb", since_date="2024-01-01", days=7
-    ):
+    @staticmethod
+    def _search_prs_query(owner, repo, since_date, days):
         """
-        Fetch merged pull requests from since_date for N days
-        Uses GitHub GraphQL API v4 with search for efficient data fetching
-
-        Args:
-            since_date: Start date in YYYY-MM-DD format (required)
-            days: Number of days from since_date (default: 30)
+        Build the search string for PRs merged in [since_date, since_date + days)
         """
         if since_date is None:
             raise ValueError("since_date is required")
@@ -90,63 +173,20 @@ class GitHubClient:
         start_date = start_dt.strftime("%Y-%m-%d")
         end_date = (start_dt + timedelta(days=days - 1)).strftime("%Y-%m-%d")
 
-        # GraphQL API endpoint
-        url = "https://api.github.com/graphql"
+        return f"repo:{owner}/{repo} type:pr is:merged merged:{start_date}..{end_date}"
 
-        # GraphQL query using search API with all required fields for process_pr
-        query = """
-        query($searchQuery: String!, $cursor: String) {
-          search(query: $searchQuery, type: ISSUE, first: 100, after: $cursor) {
-            issueCount
-            pageInfo {
-              hasNextPage
-              endCursor
-            }
-            nodes {
-              ... on PullRequest {
-                number
-                title
-                body
-                createdAt
-                mergedAt
-                author {
-                  login
-                }
-                labels(first: 50) {
-                  nodes {
-                    name
-                  }
-                }
-                comments(first: 100) {
-                  nodes {
-                    databaseId
-                    author {
-                      login
-                      __typename
-                    }
-                    body
-                    createdAt
-                    updatedAt
-                    url
-                  }
-                }
-                headRefName
-                baseRefName
-                additions
-                deletions
-                mergeCommit {
-                  oid
-                }
-              }
-            }
-          }
-        }
+    def get_iotdb_prs(
+        self, owner="apache", repo="iotdb", since_date="2024-01-01", days=7
+    ):
         """
+        Fetch merged pull requests from since_date for N days
+        Uses GitHub GraphQL API v4 with search for efficient data fetching
 
-        # Build search query string
-        search_query = (
-            f"repo:{owner}/{repo} type:pr is:merged merged:{start_date}..{end_date}"
-        )
+        Args:
+            since_date: Start date in YYYY-MM-DD format (required)
+            days: Number of days from since_date (default: 30)
+        """
+        search_query = self._search_prs_query(owner, repo, since_date, days)
 
         prs = []
         cursor = None
@@ -155,10 +195,12 @@ class GitHubClient:
             variables = {"searchQuery": search_query, "cursor": cursor}
 
             try:
-                response = requests.post(
-                    url,
-                    json={"query": query, "variables": variables},
-                    headers=self.headers,
+                response = self.session.post(
+                    GRAPHQL_URL,
+                    data=orjson.dumps(
+                        {"query": SEARCH_PRS_QUERY, "variables": variables}
+                    ),
+                    headers=self.json_headers,
                     timeout=30,
                 )
 
@@ -166,7 +208,7 @@ class GitHubClient:
                     logger.error(f"GraphQL API error: HTTP {response.status_code}")
                     return []
 
-                result = response.json()
+                result = orjson.loads(response.content)
 
                 # Check for errors
                 if "errors" in result:
@@ -198,6 +240,65 @@ class GitHubClient:
 
         return prs
 
+    async def iter_iotdb_prs_async(
+        self, session, owner="apache", repo="iotdb", since_date="2024-01-01", days=7
+    ):
+        """
+        Async generator over merged pull requests from since_date for N days,
+        yielding one list of PRs per GraphQL page so callers can start
+        processing the first page while the next one is being fetched
+
+        Args:
+            session: aiohttp session carrying the GitHub auth headers
+            since_date: Start date in YYYY-MM-DD format (required)
+            days: Number of days from since_date
+        """
+        search_query = self._search_prs_query(owner, repo, since_date, days)
+        cursor = None
+
+        while True:
+            variables = {"searchQuery": search_query, "cursor": cursor}
+
+            try:
+                async with session.post(
+                    GRAPHQL_URL,
+                    data=orjson.dumps(
+                        {"query": SEARCH_PRS_QUERY, "variables": variables}
+                    ),
+                    headers={"Content-Type": "application/json"},
+                    timeout=aiohttp.ClientTimeout(total=30),
+                ) as response:
+                    if response.status != 200:
+                        logger.error(f"GraphQL API error: HTTP {response.status}")
+                        return
+                    result = orjson.loads(await response.read())
+
+                # Check for errors
+                if "errors" in result:
+                    logger.error(f"GraphQL error: {result['errors']}")
+                    return
+
+                search_result = result["data"]["search"]
+                page_info = search_result["pageInfo"]
+                page = [
+                    self._transform_pr_data(node, owner, repo)
+                    for node in search_result["nodes"]
+                ]
+            except aiohttp.ClientError as e:
+                logger.error(f"Network error: {str(e)}")
+                return
+            except Exception as e:
+                logger.error(f"Error processing GraphQL response: {str(e)}")
+                return
+
+            yield page
+
+            # Check if there are more pages
+            if not page_info["hasNextPage"]:
+                return
+
+            cursor = page_info["endCursor"]
+
     def get_iotdb_pr(self, pr_number, owner="apache", repo="iotdb"):
         """
         Get detailed information about a specific pull request using GraphQL
@@ -252,17 +353,17 @@ class GitHubClient:
         variables = {"owner": owner, "repo": repo, "number": pr_number}
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 url,
-                json={"query": query, "variables": variables},
-                headers=self.headers,
+                data=orjson.dumps({"query": query, "variables": variables}),
+                headers=self.json_headers,
                 timeout=30,
             )
 
             if response.status_code != 200:
                 return None, f"GraphQL API error: HTTP {response.status_code}"
 
-            result = response.json()
+            result = orjson.loads(response.content)
 
             # Check for errors
             if "errors" in result:
@@ -297,14 +398,14 @@ class GitHubClient:
         while True:
             params["page"] = page
             try:
-                response = requests.get(
+                response = self.session.get(
                     url, headers=self.headers, params=params, timeout=30
                 )
 
                 if response.status_code != 200:
                     return None, f"HTTP {response.status_code}"
 
-                page_comments = response.json()
+                page_comments = orjson.loads(response.content)
                 if not page_comments:
                     break
 
@@ -357,7 +458,7 @@ class GitHubClient:
         Download image from URL
         """
         try:
-            response = requests.get(image_url, timeout=30)
+            response = self.session.get(image_url, timeout=30)
             if response.status_code == 200:
                 content_type = response.headers.get("content-type", "")
                 if "image" in content_type:
@@ -386,10 +487,25 @@ class GitHubClient:
         Fetch diff content from diff_url
         """
         try:
-            response = requests.get(diff_url, headers=self.headers, timeout=30)
+            response = self.session.get(diff_url, headers=self.headers, timeout=30)
             if response.status_code == 200:
                 return response.text, None
             else:
                 return None, f"HTTP {response.status_code}"
         except Exception as e:
             return None, f"Download error: {str(e)}"
+
+    async def get_diff_content_async(self, session, diff_url):
+        """
+        Fetch diff content from diff_url using a shared aiohttp session
+        """
+        try:
+            async with session.get(
+                diff_url, timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                if response.status == 200:
+                    return await response.text(), None
+                else:
+                    return None, f"HTTP {response.status}"
+        except Exception as e:
+            return None, f"Download error: {str(e)}"
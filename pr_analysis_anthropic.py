@@ -1,10 +1,43 @@
 import asyncio
-import json
+import fnmatch
+import functools
+import hashlib
+import mmap
+import os
+import re
 import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 
 import anthropic
+import httpx
+import orjson
+
+try:
+    import hyperscan
+
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import uvloop
+
+    UVLOOP_AVAILABLE = sys.platform != "win32"
+except ImportError:
+    UVLOOP_AVAILABLE = False
 from database import DatabaseManager
 from config import ANTHROPIC_BASE_URL, ANTHROPIC_API_KEY, DEFAULT_IOTDB_SOURCE_DIR
 from logger_config import setup_logger
@@ -12,11 +45,247 @@ from logger_config import setup_logger
 logger = setup_logger(__name__)
 
 from pr_analysis_common import (
-    build_analysis_query,
+    ANALYSIS_RUBRIC,
+    DANGEROUS_GIT_COMMANDS,
+    SAFE_GIT_COMMANDS,
+    SAFE_GIT_COMMANDS_TEXT,
+    SHELL_OPERATOR_RE,
+    build_analysis_blocks,
     get_pr_by_number,
     get_tool_system_prompt,
+    trim_diff_content,
 )
 
+# 同一轮内并发执行工具调用的线程池
+_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pr-tool")
+
+# ripgrep --json 输出中匹配行的前缀
+RG_MATCH_PREFIX = b'{"type":"match"'
+
+# grep 工具 Hyperscan 编译结果缓存的最大条目数
+HS_DB_CACHE_MAXSIZE = 128
+# grep 工具最多返回的匹配数，找到这么多匹配后停止搜索
+GREP_MAX_MATCHES = 50
+# grep 工具的搜索时限（秒），超时后返回已找到的匹配
+GREP_TIMEOUT = 10
+
+# read 工具文件内容缓存的最大条目数
+READ_CACHE_MAXSIZE = 64
+# read 工具默认最多读取的字节数
+READ_DEFAULT_LIMIT = 2_000_000
+# 小于该字节数的文件直接 read()，不使用 mmap
+READ_MMAP_THRESHOLD = 65536
+
+# 流式输出缓冲达到该字节数时写出
+STREAM_FLUSH_BYTES = 512
+
+# Message Batches API 单个批处理的最大请求数
+MAX_BATCH_REQUESTS = 10000
+
+# 分析使用的模型
+# ANTHROPIC_MODEL = "claude-sonnet-4-5-20250929"
+ANTHROPIC_MODEL = "glm-4.6"
+
+
+# 小 PR 使用的低成本模型（diff 小于 SMALL_DIFF_CHARS 字符时）
+# TRIAGE_MODEL = "claude-haiku-4-5"
+TRIAGE_MODEL = "glm-4.5-air"
+SMALL_DIFF_CHARS = 4096
+
+# 大 diff 预过滤使用的低成本模型
+# DIFF_FILTER_MODEL = "claude-haiku-4-5"
+DIFF_FILTER_MODEL = "glm-4.5-air"
+# diff 超过该字符数时才进行预过滤
+DIFF_FILTER_MIN_CHARS = 20000
+
+DIFF_FILTER_PROMPT = """你是代码审查助手。下面是一个 IoTDB PR 的 diff。
+请只保留对判断缺陷修复语义有意义的 hunk，删除以下内容：
+- 仅空白或格式调整的 hunk
+- 仅 import 增删或重排的 hunk
+- 自动生成文件（如 thrift/protobuf 生成代码、lock 文件）的改动
+
+保留的 hunk 必须连同其 diff --git 文件头原样输出，不要修改内容，不要添加任何解释。"""
+
+# 不启用工具时的系统提示
+NO_TOOL_SYSTEM_PROMPT = "您是一名时序数据库IoTDB专家，请根据提供的PR信息和本地iotdb源码进行分析，然后提供详细的分析结果。"
+
+# 进程内共享的 Anthropic 客户端（复用 HTTP 连接）
+_ASYNC_ANTHROPIC_CLIENT: Optional[anthropic.AsyncAnthropic] = None
+# 异步客户端所属的事件循环，连接池中的连接只能在该循环中使用
+_ASYNC_ANTHROPIC_CLIENT_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+# analyze_prs 默认的最大并发分析数
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+# 单次响应的 token 使用情况
+UsageTuple = namedtuple("UsageTuple", "input output cache_create cache_read")
+
+
+def read_usage(usage_info) -> UsageTuple:
+    """
+    读取响应的 token 使用情况（兼容不返回缓存字段的服务端）
+
+    Args:
+        usage_info: 响应中的 usage 对象
+    """
+    return UsageTuple(
+        usage_info.input_tokens,
+        usage_info.output_tokens,
+        getattr(usage_info, "cache_creation_input_tokens", 0) or 0,
+        getattr(usage_info, "cache_read_input_tokens", 0) or 0,
+    )
+
+
+async def write_text_stream(text_stream) -> None:
+    """
+    将流式文本批量写到标准输出
+
+    文本先累积到缓冲区，达到 STREAM_FLUSH_BYTES 字节或出现换行时才写出，
+    避免每个 token 都触发一次 write 系统调用
+
+    Args:
+        text_stream: 逐段产生文本的异步迭代器
+    """
+    # 先写出 print 留在文本层缓冲区里的内容，保证输出顺序
+    sys.stdout.flush()
+    out = sys.stdout.buffer
+    buf = bytearray()
+    async for text in text_stream:
+        buf += text.encode("utf-8")
+        if len(buf) >= STREAM_FLUSH_BYTES or "\n" in text:
+            out.write(buf)
+            out.flush()
+            buf.clear()
+    if buf:
+        out.write(buf)
+        out.flush()
+
+
+def install_event_loop() -> None:
+    """
+    安装 uvloop 作为 asyncio 事件循环（未安装或 Windows 平台时使用默认事件循环）
+
+    需在 asyncio.run 之前调用；之后进程内的每次 asyncio.run 都使用 uvloop
+    （uvloop.install() 在新版本中已弃用，这里直接设置事件循环策略）
+    """
+    if UVLOOP_AVAILABLE:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.debug("已启用 uvloop 事件循环")
+
+
+def get_async_anthropic_client() -> anthropic.AsyncAnthropic:
+    """
+    获取当前事件循环共享的异步 Anthropic 客户端，首次调用时创建
+
+    流式分析使用异步客户端，等待响应时不阻塞事件循环，多个分析可以并发执行。
+    连接池绑定在创建它的事件循环上，每次 asyncio.run 都会得到新的循环，
+    循环变化时重新创建客户端，避免复用已关闭循环中的连接
+    """
+    global _ASYNC_ANTHROPIC_CLIENT, _ASYNC_ANTHROPIC_CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _ASYNC_ANTHROPIC_CLIENT is None or _ASYNC_ANTHROPIC_CLIENT_LOOP is not loop:
+        _ASYNC_ANTHROPIC_CLIENT = anthropic.AsyncAnthropic(
+            base_url=ANTHROPIC_BASE_URL,
+            api_key=ANTHROPIC_API_KEY,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=300),
+            ),
+        )
+        _ASYNC_ANTHROPIC_CLIENT_LOOP = loop
+    return _ASYNC_ANTHROPIC_CLIENT
+
+
+async def close_async_anthropic_client():
+    """
+    关闭共享的异步 Anthropic 客户端及其连接池
+    """
+    global _ASYNC_ANTHROPIC_CLIENT, _ASYNC_ANTHROPIC_CLIENT_LOOP
+    client = _ASYNC_ANTHROPIC_CLIENT
+    loop = _ASYNC_ANTHROPIC_CLIENT_LOOP
+    _ASYNC_ANTHROPIC_CLIENT = None
+    _ASYNC_ANTHROPIC_CLIENT_LOOP = None
+    # 其他（已关闭的）事件循环创建的客户端无法在当前循环中关闭，直接丢弃
+    if client is not None and loop is asyncio.get_running_loop():
+        await client.close()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_rg_type_globs() -> Optional[Dict[str, Tuple[str, ...]]]:
+    """
+    读取 ripgrep 内置的文件类型定义（rg --type-list），使进程内搜索的类型过滤与 --type 一致
+
+    Returns:
+        类型名到 glob 列表的映射，ripgrep 不可用时返回 None
+    """
+    try:
+        result = subprocess.run(
+            ["rg", "--type-list"], capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+
+    type_globs = {}
+    for line in result.stdout.splitlines():
+        name, sep, globs = line.partition(":")
+        if sep:
+            type_globs[name.strip()] = tuple(glob.strip() for glob in globs.split(","))
+    return type_globs
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_name_pattern(name_pattern: str) -> "re.Pattern":
+    """
+    将文件名 glob 模式编译为正则表达式（带缓存）
+    """
+    return re.compile(fnmatch.translate(name_pattern))
+
+
+def select_analysis_model(diff_content: Optional[str]) -> str:
+    """
+    按 diff 大小选择分析模型：小 PR 使用低成本的 TRIAGE_MODEL，其余使用 ANTHROPIC_MODEL
+    """
+    diff_size = len(diff_content) if diff_content else 0
+    return TRIAGE_MODEL if diff_size < SMALL_DIFF_CHARS else ANTHROPIC_MODEL
+
+
+def build_analysis_cache_key(
+    pr_number: int,
+    diff_content: Optional[str],
+    system_prompt: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    filter_diff: bool,
+) -> str:
+    """
+    计算PR分析结果的缓存键
+
+    Args:
+        pr_number: PR编号
+        diff_content: diff 内容（过滤前的原始 diff）
+        system_prompt: 系统提示词
+        model: 模型名称
+        temperature: 温度参数
+        max_tokens: 最大输出 tokens
+        filter_diff: 是否用低成本模型过滤 diff
+
+    Returns:
+        SHA-256 十六进制字符串
+    """
+    diff_content = diff_content or ""
+    # 小于 DIFF_FILTER_MIN_CHARS 的 diff 不会被过滤，两种设置得到相同的结果
+    filtered = filter_diff and len(diff_content) >= DIFF_FILTER_MIN_CHARS
+    hasher = hashlib.sha256()
+    for part in (str(pr_number), diff_content, system_prompt, model):
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")
+    hasher.update(f"{temperature}\0{max_tokens}\0{int(filtered)}".encode("utf-8"))
+    return hasher.hexdigest()
+
 
 def get_tool_definitions() -> List[Dict]:
     """
@@ -32,7 +301,15 @@ def get_tool_definitions() -> List[Dict]:
                     "file_path": {
                         "type": "string",
                         "description": "要读取的文件路径，相对于 IoTDB 源码根目录（如 'iotdb-core/datanode/src/main/java/org/apache/iotdb/db/queryengine/execution/operator/process/TableIntoOperator.java'）",
-                    }
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "可选：从第几个字节开始读取（默认 0）",
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": f"可选：最多读取的字节数（默认 {READ_DEFAULT_LIMIT}）",
+                    },
                 },
                 "required": ["file_path"],
             },
@@ -104,34 +381,150 @@ class PRAnalysisAnthropic:
         """
         self.iotdb_source_dir = Path(iotdb_source_dir)
         self.db = DatabaseManager()
-
-    def _execute_read_tool(self, file_path: str) -> Dict:
+        # grep 工具的 Hyperscan 编译结果缓存（pattern -> Database）
+        self._hs_db_cache: "OrderedDict[str, Optional[hyperscan.Database]]" = (
+            OrderedDict()
+        )
+        self._hs_lock = threading.Lock()
+        # read 工具的 LRU 缓存，键为 (file_path, st_mtime_ns, st_size, offset, limit)
+        self._read_cache: "OrderedDict[Tuple[str, int, int, int, int], Dict]" = (
+            OrderedDict()
+        )
+        self._read_cache_lock = threading.Lock()
+        # glob 工具使用的源码文件列表缓存: (缓存键, 相对路径列表)
+        self._file_list_cache: Optional[Tuple[Tuple[int, int], List[str]]] = None
+        self._file_list_lock = threading.Lock()
+        # grep 工具搜索的文件列表缓存（与 ripgrep 一致，排除 .gitignore 忽略的文件）
+        self._grep_file_list_cache: Optional[Tuple[Tuple[int, int], List[str]]] = None
+        # 工具名 -> 执行函数（参数为模型给出的 tool_input）
+        self._tool_handlers = {
+            "read": lambda tool_input: self._execute_read_tool(
+                tool_input.get("file_path", ""),
+                tool_input.get("offset") or 0,
+                tool_input.get("limit") or READ_DEFAULT_LIMIT,
+            ),
+            "glob": lambda tool_input: self._execute_glob_tool(
+                tool_input.get("pattern", ""), tool_input.get("path", "") or ""
+            ),
+            "grep": lambda tool_input: self._execute_grep_tool(
+                tool_input.get("pattern", ""),
+                tool_input.get("path", "") or "",
+                tool_input.get("file_type", "") or "",
+            ),
+            "git": lambda tool_input: self._execute_git_tool(
+                tool_input.get("command", "")
+            ),
+        }
+
+    def _execute_read_tool(
+        self, file_path: str, offset: int = 0, limit: int = READ_DEFAULT_LIMIT
+    ) -> Dict:
         """
         执行 read 工具：读取文件内容
 
         Args:
             file_path: 文件路径（相对于 iotdb_source_dir）
+            offset: 起始字节偏移（默认 0）
+            limit: 最多读取的字节数（默认 READ_DEFAULT_LIMIT）
 
         Returns:
             工具执行结果
         """
         try:
             full_path = self.iotdb_source_dir / file_path
-            if not full_path.exists():
+            try:
+                stat = full_path.stat()
+            except FileNotFoundError:
                 return {"success": False, "error": f"文件不存在: {file_path}"}
 
-            # 读取文件内容（限制大小）
-            with open(full_path, "r", encoding="utf-8") as f:
-                content = f.read(500000)  # 限制 500KB
-
-            return {"success": True, "content": content, "file_path": file_path}
+            offset = max(offset, 0)
+            limit = limit if limit > 0 else READ_DEFAULT_LIMIT
+
+            # 文件未修改时直接复用缓存内容
+            cache_key = (file_path, stat.st_mtime_ns, stat.st_size, offset, limit)
+            with self._read_cache_lock:
+                cached = self._read_cache.get(cache_key)
+                if cached is not None:
+                    self._read_cache.move_to_end(cache_key)
+                    return cached
+
+            # 小文件直接读取；大文件使用 mmap，只按需加载请求范围内的页
+            with open(full_path, "rb") as f:
+                if stat.st_size < READ_MMAP_THRESHOLD:
+                    data = f.read()[offset : offset + limit]
+                elif offset >= stat.st_size:
+                    data = b""
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        data = mm[offset : offset + limit]
+            # 非 UTF-8 字节（或截断处的半个字符）用替换字符代替
+            content = data.decode("utf-8", errors="replace")
+
+            result = {
+                "success": True,
+                "content": content,
+                "file_path": file_path,
+                "offset": offset,
+                "size": stat.st_size,
+            }
+            with self._read_cache_lock:
+                self._read_cache[cache_key] = result
+                if len(self._read_cache) > READ_CACHE_MAXSIZE:
+                    self._read_cache.popitem(last=False)
+            return result
         except Exception as e:
             return {"success": False, "error": f"读取文件失败: {str(e)}"}
 
+    def _file_list_cache_key(self) -> Tuple[int, int]:
+        """文件列表缓存键：源码根目录和 .git/index 的 mtime"""
+        root = str(self.iotdb_source_dir)
+        git_index = os.path.join(root, ".git", "index")
+        return (
+            os.stat(root).st_mtime_ns,
+            os.stat(git_index).st_mtime_ns if os.path.exists(git_index) else 0,
+        )
+
+    def _get_source_file_list(self) -> List[str]:
+        """
+        获取源码目录下所有文件的相对路径（跳过 .git）
+
+        结果按源码根目录和 .git/index 的 mtime 缓存，git checkout 会更新 index，
+        从而使缓存失效
+
+        Returns:
+            相对路径列表（使用 "/" 分隔）
+        """
+        root = str(self.iotdb_source_dir)
+        cache_key = self._file_list_cache_key()
+
+        with self._file_list_lock:
+            if self._file_list_cache and self._file_list_cache[0] == cache_key:
+                return self._file_list_cache[1]
+
+            files = []
+            stack = [("", root)]
+            while stack:
+                rel_dir, abs_dir = stack.pop()
+                with os.scandir(abs_dir) as entries:
+                    for entry in entries:
+                        rel_path = f"{rel_dir}{entry.name}"
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name != ".git":
+                                stack.append((rel_path + "/", entry.path))
+                        else:
+                            files.append(rel_path)
+
+            files.sort()
+            self._file_list_cache = (cache_key, files)
+            return files
+
     def _execute_glob_tool(self, pattern: str, path: str = "") -> Dict:
         """
         执行 glob 工具：查找匹配的文件
 
+        "**/<文件名模式>" 形式的模式直接在缓存的文件列表上按文件名匹配，
+        其他模式使用 Path.glob
+
         Args:
             pattern: glob 模式（如 "**/*.java"）
             path: 搜索路径（相对于 iotdb_source_dir）
@@ -140,13 +533,28 @@ class PRAnalysisAnthropic:
             工具执行结果
         """
         try:
-            search_dir = self.iotdb_source_dir / path if path else self.iotdb_source_dir
-            matches = list(search_dir.glob(pattern))
+            name_pattern = pattern[3:] if pattern.startswith("**/") else None
+            if name_pattern and "/" not in name_pattern and "**" not in name_pattern:
+                name_regex = _compile_name_pattern(name_pattern)
+                prefix = path.strip("/") + "/" if path.strip("/") else ""
+                relative_paths = []
+                for rel_path in self._get_source_file_list():
+                    if not rel_path.startswith(prefix):
+                        continue
+                    if name_regex.match(rel_path.rsplit("/", 1)[-1]):
+                        relative_paths.append(rel_path)
+                        if len(relative_paths) >= 100:  # 限制 100 个结果
+                            break
+            else:
+                search_dir = (
+                    self.iotdb_source_dir / path if path else self.iotdb_source_dir
+                )
+                matches = list(search_dir.glob(pattern))
 
-            # 转换为相对路径
-            relative_paths = [
-                str(p.relative_to(self.iotdb_source_dir)) for p in matches[:100]
-            ]  # 限制 100 个结果
+                # 转换为相对路径
+                relative_paths = [
+                    str(p.relative_to(self.iotdb_source_dir)) for p in matches[:100]
+                ]  # 限制 100 个结果
 
             return {
                 "success": True,
@@ -156,12 +564,244 @@ class PRAnalysisAnthropic:
         except Exception as e:
             return {"success": False, "error": f"Glob 搜索失败: {str(e)}"}
 
+    def _get_hyperscan_db(self, pattern: str) -> Optional["hyperscan.Database"]:
+        """
+        获取（必要时编译）pattern 对应的 Hyperscan 数据库
+
+        与 ripgrep 一致按行匹配：启用 HS_FLAG_MULTILINE，使 ^ 和 $ 匹配每一行的首尾
+
+        Args:
+            pattern: 搜索模式（正则表达式）
+
+        Returns:
+            编译好的 Hyperscan 数据库，不可用或无法编译时返回 None
+        """
+        if not HYPERSCAN_AVAILABLE:
+            return None
+
+        with self._hs_lock:
+            if pattern in self._hs_db_cache:
+                self._hs_db_cache.move_to_end(pattern)
+                return self._hs_db_cache[pattern]
+
+        try:
+            db = hyperscan.Database()
+            db.compile(
+                expressions=[pattern.encode("utf-8")],
+                ids=[0],
+                elements=1,
+                flags=[hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_MULTILINE],
+            )
+        except hyperscan.error as e:
+            logger.debug(f"Hyperscan 无法编译模式 '{pattern}': {e}")
+            db = None
+
+        with self._hs_lock:
+            self._hs_db_cache[pattern] = db
+            if len(self._hs_db_cache) > HS_DB_CACHE_MAXSIZE:
+                self._hs_db_cache.popitem(last=False)
+        return db
+
+    def _get_grep_file_list(self) -> List[str]:
+        """
+        获取 grep 工具搜索的文件列表（相对路径，使用 "/" 分隔）
+
+        与 ripgrep 的默认行为一致：git 仓库中排除 .gitignore 忽略的文件，
+        并跳过隐藏文件和目录。缓存方式与 _get_source_file_list 相同
+        """
+        cache_key = self._file_list_cache_key()
+
+        with self._file_list_lock:
+            if (
+                self._grep_file_list_cache
+                and self._grep_file_list_cache[0] == cache_key
+            ):
+                return self._grep_file_list_cache[1]
+
+        try:
+            result = subprocess.run(
+                ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+                cwd=str(self.iotdb_source_dir),
+                capture_output=True,
+                timeout=30,
+            )
+            if result.returncode != 0:
+                raise OSError(result.stderr.decode("utf-8", errors="replace"))
+            candidates = sorted(
+                set(result.stdout.decode("utf-8", errors="surrogateescape").split("\0"))
+                - {""}
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            # 不是 git 仓库（或没有 git）时 ripgrep 也不使用 .gitignore
+            logger.debug(f"git ls-files 失败，搜索全部文件: {e}")
+            candidates = self._get_source_file_list()
+
+        files = [
+            rel_path
+            for rel_path in candidates
+            if not any(part.startswith(".") for part in rel_path.split("/"))
+        ]
+
+        with self._file_list_lock:
+            self._grep_file_list_cache = (cache_key, files)
+        return files
+
+    def _scan_file_with_hyperscan(
+        self,
+        db: "hyperscan.Database",
+        scratch: "hyperscan.Scratch",
+        file_path: str,
+        limit: int,
+    ) -> List[Dict]:
+        """
+        使用 Hyperscan 扫描单个文件（每行最多记录一次匹配）
+
+        与 ripgrep 一致跳过二进制文件（包含 NUL 字节）；UTF-8 模式下扫描非法
+        UTF-8 数据得到的匹配不可靠，这类文件同样跳过。两项检查只对有匹配的
+        文件进行，没有匹配的文件只扫描一遍
+
+        Args:
+            db: 编译好的 Hyperscan 数据库
+            scratch: 当前调用独占的 scratch 空间
+            file_path: 文件绝对路径
+            limit: 最多返回的匹配数
+
+        Returns:
+            该文件中的匹配列表
+        """
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end_offsets = []
+
+                def on_match(_id, _from, to, _flags, _context):
+                    end_offsets.append(to)
+
+                db.scan(
+                    data,
+                    match_event_handler=on_match,
+                    scratch=scratch,
+                )
+                if not end_offsets:
+                    return []
+
+                if data.find(b"\0") != -1:
+                    return []
+                try:
+                    str(data, "utf-8")
+                except UnicodeDecodeError:
+                    return []
+
+                rel_path = os.path.relpath(file_path, self.iotdb_source_dir)
+                matches = []
+                line_number = 1
+                last_pos = 0
+                last_line_end = -1
+                for end_offset in sorted(end_offsets):
+                    if len(matches) >= limit:
+                        break
+                    # 使用匹配的最后一个字节定位所在行
+                    pos = max(end_offset - 1, 0)
+                    if pos <= last_line_end:
+                        continue
+                    line_number += data[last_pos:pos].count(b"\n")
+                    last_pos = pos
+                    line_start = data.rfind(b"\n", 0, pos) + 1
+                    line_end = data.find(b"\n", pos)
+                    if line_end == -1:
+                        line_end = len(data)
+                    last_line_end = line_end
+                    line_text = data[line_start:line_end].decode(
+                        "utf-8", errors="replace"
+                    )
+                    matches.append(
+                        {
+                            "file": rel_path,
+                            "line": line_number,
+                            "content": line_text.strip(),
+                        }
+                    )
+                return matches
+
+    def _scan_with_hyperscan(
+        self, db: "hyperscan.Database", search_dir: Path, file_type: str = ""
+    ) -> Tuple[List[Dict], bool]:
+        """
+        使用 Hyperscan 在进程内搜索目录下的文件内容
+
+        与 ripgrep 路径一致：找到 GREP_MAX_MATCHES 个匹配或超过 GREP_TIMEOUT 秒后停止，
+        文件类型按 ripgrep 的类型定义（rg --type-list）过滤
+
+        Args:
+            db: 编译好的 Hyperscan 数据库
+            search_dir: 搜索目录（或单个文件）
+            file_type: 文件类型过滤（如 "java", "py"）
+
+        Returns:
+            (匹配列表, 是否提前停止)，匹配格式与 ripgrep 解析结果一致
+        """
+        deadline = time.monotonic() + GREP_TIMEOUT
+        root = str(self.iotdb_source_dir)
+
+        if search_dir.is_file():
+            file_paths = [str(search_dir)]
+        else:
+            rel_dir = os.path.relpath(search_dir, root).replace(os.sep, "/")
+            prefix = "" if rel_dir == "." else rel_dir + "/"
+            file_paths = [
+                os.path.join(root, rel_path)
+                for rel_path in self._get_grep_file_list()
+                if rel_path.startswith(prefix)
+            ]
+
+        if file_type:
+            type_globs = _get_rg_type_globs()
+            if type_globs is None:
+                # 没有 ripgrep 时按扩展名过滤
+                globs = (f"*.{file_type}",)
+            else:
+                # ripgrep 不认识的类型不会搜索任何文件
+                globs = type_globs.get(file_type, ())
+            file_paths = [
+                file_path
+                for file_path in file_paths
+                if any(
+                    fnmatch.fnmatchcase(os.path.basename(file_path), glob)
+                    for glob in globs
+                )
+            ]
+
+        # 每次调用分配独立的 scratch 空间，并发的 grep 调用无需互斥
+        scratch = hyperscan.Scratch(db)
+        # 多找一个匹配，用来判断结果是否被截断
+        matches = []
+        for file_path in file_paths:
+            if len(matches) > GREP_MAX_MATCHES:
+                break
+            if time.monotonic() > deadline:
+                return matches, True
+            try:
+                matches.extend(
+                    self._scan_file_with_hyperscan(
+                        db, scratch, file_path, GREP_MAX_MATCHES + 1 - len(matches)
+                    )
+                )
+            except (OSError, ValueError):
+                continue
+
+        return matches[:GREP_MAX_MATCHES], len(matches) > GREP_MAX_MATCHES
+
     def _execute_grep_tool(
         self, pattern: str, path: str = "", file_type: str = ""
     ) -> Dict:
         """
         执行 grep 工具：搜索文件内容
 
+        优先使用进程内的 Hyperscan 扫描，未安装或模式无法编译时回退到 ripgrep。
+        两种方式都在找到 GREP_MAX_MATCHES 个匹配或超过 GREP_TIMEOUT 秒后停止，
+        此时结果中 truncated 为 True
+
         Args:
             pattern: 搜索模式（正则表达式）
             path: 搜索路径（相对于 iotdb_source_dir）
@@ -173,46 +813,79 @@ class PRAnalysisAnthropic:
         try:
             search_dir = self.iotdb_source_dir / path if path else self.iotdb_source_dir
 
+            hs_db = self._get_hyperscan_db(pattern)
+            if hs_db is not None:
+                matches, truncated = self._scan_with_hyperscan(
+                    hs_db, search_dir, file_type
+                )
+                return {
+                    "success": True,
+                    "matches": matches,
+                    "count": len(matches),
+                    "truncated": truncated,
+                }
+
             # 构建 rg (ripgrep) 命令
             cmd = ["rg", "--json", pattern, str(search_dir)]
             if file_type:
                 cmd.extend(["--type", file_type])
 
-            # 执行搜索
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+            # 执行搜索，逐行读取输出（超时 GREP_TIMEOUT 秒后终止进程）
+            proc = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                proc.kill()
 
-            # 解析结果
+            timer = threading.Timer(GREP_TIMEOUT, on_timeout)
+            timer.start()
+
+            # 解析结果（只解析 match 类型的行，begin/end/summary 行直接跳过）
             matches = []
-            for line in result.stdout.strip().split("\n"):
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line)
-                    if data.get("type") == "match":
-                        match_data = data.get("data", {})
-                        file_path = match_data.get("path", {}).get("text", "")
-                        line_number = match_data.get("line_number")
-                        line_text = match_data.get("lines", {}).get("text", "").strip()
-
-                        # 转换为相对路径
-                        if file_path:
-                            rel_path = str(
-                                Path(file_path).relative_to(self.iotdb_source_dir)
-                            )
-                            matches.append(
-                                {
-                                    "file": rel_path,
-                                    "line": line_number,
-                                    "content": line_text,
-                                }
-                            )
-                except json.JSONDecodeError:
-                    continue
+            truncated = False
+            try:
+                for line in proc.stdout:
+                    if not line.startswith(RG_MATCH_PREFIX):
+                        continue
+                    if len(matches) >= GREP_MAX_MATCHES:
+                        # 已找到足够的匹配，不再等待 ripgrep 搜索其余文件
+                        truncated = True
+                        proc.kill()
+                        break
+                    try:
+                        match_data = orjson.loads(line)["data"]
+                    except (orjson.JSONDecodeError, KeyError):
+                        continue
+
+                    file_path = match_data.get("path", {}).get("text", "")
+                    line_number = match_data.get("line_number")
+                    line_text = match_data.get("lines", {}).get("text", "").strip()
+
+                    # 转换为相对路径
+                    if file_path:
+                        rel_path = str(
+                            Path(file_path).relative_to(self.iotdb_source_dir)
+                        )
+                        matches.append(
+                            {
+                                "file": rel_path,
+                                "line": line_number,
+                                "content": line_text,
+                            }
+                        )
+            finally:
+                timer.cancel()
+                proc.stdout.close()
+                proc.wait()
 
             return {
                 "success": True,
-                "matches": matches[:50],  # 限制 50 个结果
+                "matches": matches,
                 "count": len(matches),
+                "truncated": truncated or timed_out.is_set(),
             }
         except FileNotFoundError:
             return {
@@ -243,13 +916,12 @@ class PRAnalysisAnthropic:
                 return {"success": False, "error": "只允许 git 命令"}
 
             # 检查是否包含管道或重定向操作符
-            shell_operators = ["|", ">", ">>", "<", "&&", "||", ";"]
-            for operator in shell_operators:
-                if operator in cmd_stripped:
-                    return {
-                        "success": False,
-                        "error": f"Git 命令不允许包含 shell 操作符 '{operator}'。请使用纯 git 命令。",
-                    }
+            operator_match = SHELL_OPERATOR_RE.search(cmd_stripped)
+            if operator_match:
+                return {
+                    "success": False,
+                    "error": f"Git 命令不允许包含 shell 操作符 '{operator_match.group()}'。请使用纯 git 命令。",
+                }
 
             # 解析 git 命令
             cmd_parts = cmd_stripped.split()
@@ -258,44 +930,16 @@ class PRAnalysisAnthropic:
 
             git_subcmd = cmd_parts[1].lower()
 
-            # 允许的安全 git 命令（只读 + checkout）
-            safe_git_commands = {
-                "checkout",
-                "status",
-                "log",
-                "show",
-                "diff",
-                "branch",
-                "rev-parse",
-                "ls-tree",
-                "ls-files",
-            }
-
-            # 危险命令黑名单
-            dangerous_git_commands = {
-                "push",
-                "reset",
-                "clean",
-                "rm",
-                "commit",
-                "rebase",
-                "merge",
-                "pull",
-                "fetch",
-                "add",
-            }
-
-            if git_subcmd in dangerous_git_commands:
+            if git_subcmd in DANGEROUS_GIT_COMMANDS:
                 return {
                     "success": False,
                     "error": f"禁止执行危险的 git 命令: git {git_subcmd}",
                 }
 
-            if git_subcmd not in safe_git_commands:
-                allowed_list = ", ".join(sorted(safe_git_commands))
+            if git_subcmd not in SAFE_GIT_COMMANDS:
                 return {
                     "success": False,
-                    "error": f"Git 命令 '{git_subcmd}' 不在允许列表中（允许: {allowed_list}）",
+                    "error": f"Git 命令 '{git_subcmd}' 不在允许列表中（允许: {SAFE_GIT_COMMANDS_TEXT}）",
                 }
 
             # 使用 shell=False 执行命令（禁用管道、重定向等）
@@ -335,22 +979,52 @@ class PRAnalysisAnthropic:
         Returns:
             工具执行结果
         """
-        if tool_name == "read":
-            return self._execute_read_tool(tool_input.get("file_path", ""))
-        elif tool_name == "glob":
-            return self._execute_glob_tool(
-                tool_input.get("pattern", ""), tool_input.get("path", "") or ""
+        handler = self._tool_handlers.get(tool_name)
+        if handler is None:
+            return {"success": False, "error": f"未知工具: {tool_name}"}
+        return handler(tool_input)
+
+    async def _filter_diff(
+        self, client: anthropic.AsyncAnthropic, diff_content: str
+    ) -> str:
+        """
+        使用低成本模型过滤大 diff 中与缺陷分析无关的 hunk
+
+        过滤失败或输出被截断时返回原始 diff
+
+        Args:
+            client: Anthropic 客户端
+            diff_content: 原始 diff 内容
+
+        Returns:
+            过滤后的 diff 内容
+        """
+        try:
+            response = await client.messages.create(
+                model=DIFF_FILTER_MODEL,
+                max_tokens=32000,
+                temperature=0,
+                system=DIFF_FILTER_PROMPT,
+                messages=[{"role": "user", "content": diff_content}],
             )
-        elif tool_name == "grep":
-            return self._execute_grep_tool(
-                tool_input.get("pattern", ""),
-                tool_input.get("path", "") or "",
-                tool_input.get("file_type", "") or "",
+            if response.stop_reason == "max_tokens":
+                logger.warning("⚠️ Diff 过滤输出被截断，使用原始 diff")
+                return diff_content
+
+            filtered = "".join(
+                block.text for block in response.content if block.type == "text"
+            ).strip()
+            if not filtered:
+                return diff_content
+
+            logger.info(
+                f"🧹 Diff 已过滤: {len(diff_content):,} -> {len(filtered):,} 字符 "
+                f"(过滤消耗输入 {response.usage.input_tokens:,} tokens)"
             )
-        elif tool_name == "git":
-            return self._execute_git_tool(tool_input.get("command", ""))
-        else:
-            return {"success": False, "error": f"未知工具: {tool_name}"}
+            return filtered
+        except Exception as e:
+            logger.warning(f"⚠️ Diff 过滤失败，使用原始 diff: {e}")
+            return diff_content
 
     def get_pr_by_number(self, pr_number: Optional[int] = None) -> Optional[Dict]:
         """
@@ -366,6 +1040,10 @@ class PRAnalysisAnthropic:
         enable_tools: bool = True,
         max_tool_rounds: int = 10,
         use_cache: bool = True,
+        use_result_cache: bool = True,
+        filter_diff: bool = True,
+        verbose: Optional[bool] = None,
+        model: Optional[str] = None,
     ) -> Dict:
         """
         使用 Anthropic API 进行 PR 分析（支持工具调用：read, glob, grep + cache_control）
@@ -377,6 +1055,12 @@ class PRAnalysisAnthropic:
             enable_tools: 是否启用工具调用（read, glob, grep）（默认 True）
             max_tool_rounds: 最大工具调用轮数（默认 10）
             use_cache: 是否使用 prompt caching（默认 True）
+            use_result_cache: 是否复用本地缓存的分析结果（默认 True）
+            filter_diff: 大 diff 是否先用低成本模型过滤无关 hunk（默认 True）
+            verbose: 是否实时输出模型的流式文本（默认仅在标准输出为终端时输出）；
+                     不输出时改用非流式接口
+            model: 使用的模型（默认按 diff 大小选择：小 PR 用 TRIAGE_MODEL，
+                   其余用 ANTHROPIC_MODEL）
         """
         # 获取PR数据
         target_pr = self.get_pr_by_number(pr_number)
@@ -391,11 +1075,6 @@ class PRAnalysisAnthropic:
         logger.info(f"🔍 正在分析 PR #{pr_number}: {target_pr['title']}")
 
         try:
-            # 初始化 Anthropic 客户端
-            client = anthropic.Anthropic(
-                base_url=ANTHROPIC_BASE_URL, api_key=ANTHROPIC_API_KEY
-            )
-
             # 获取 diff 内容
             diff_content = target_pr.get("diff_content", "")
             diff_size = len(diff_content) if diff_content else 0
@@ -403,22 +1082,59 @@ class PRAnalysisAnthropic:
                 f"📦 Diff 大小: {diff_size:,} 字符 (~{diff_size // 4:,} tokens)"
             )
 
-            # 构建完整查询
-            query = build_analysis_query(target_pr, diff_content)
-            query_size = len(query)
-            logger.info(
-                f"📊 完整查询大小: {query_size:,} 字符 (~{query_size // 4:,} tokens)"
-            )
+            # 按 diff 大小选择模型，小 PR 使用低成本模型
+            if model is None:
+                model = select_analysis_model(diff_content)
 
             # 构建系统提示（使用公共函数）
             system_prompt = (
-                get_tool_system_prompt()
-                if enable_tools
-                else "您是一名时序数据库IoTDB专家，请根据提供的PR信息和本地iotdb源码进行分析，然后提供详细的分析结果。"
+                get_tool_system_prompt() if enable_tools else NO_TOOL_SYSTEM_PROMPT
+            )
+
+            # 命中本地结果缓存时直接返回，不再调用 API
+            pr_hash = build_analysis_cache_key(
+                pr_number,
+                diff_content,
+                system_prompt + ANALYSIS_RUBRIC,
+                model,
+                temperature,
+                max_tokens,
+                filter_diff,
+            )
+            if use_result_cache:
+                cached = self.db.get_cached_analysis(pr_hash)
+                if cached:
+                    logger.info(f"♻️ PR #{pr_number} 命中本地分析缓存，跳过 API 调用")
+                    usage = orjson.loads(cached["usage_info"] or "{}")
+                    return {
+                        "success": True,
+                        "pr_number": pr_number,
+                        "analysis": cached["analysis"],
+                        "usage": usage,
+                        "cached": True,
+                    }
+
+            # 获取共享的异步 Anthropic 客户端
+            client = get_async_anthropic_client()
+
+            # diff 过大时先裁剪，再用低成本模型过滤无关 hunk
+            analysis_diff = trim_diff_content(diff_content)
+            if (
+                filter_diff
+                and analysis_diff
+                and len(analysis_diff) >= DIFF_FILTER_MIN_CHARS
+            ):
+                analysis_diff = await self._filter_diff(client, analysis_diff)
+
+            # 构建分块查询：diff 在前作为可缓存前缀，PR 信息在后
+            query_blocks = build_analysis_blocks(target_pr, analysis_diff, use_cache)
+            query_size = sum(len(block["text"]) for block in query_blocks)
+            logger.info(
+                f"📊 完整查询大小: {query_size:,} 字符 (~{query_size // 4:,} tokens)"
             )
 
             print(f"🚀 正在使用 Anthropic API 发送分析请求...")
-            print(f"   模型: GLM-4.6")
+            print(f"   模型: {model}")
             print(f"   最大输出 tokens: {max_tokens:,}")
             print(f"   Temperature: {temperature}")
             print(
@@ -426,40 +1142,15 @@ class PRAnalysisAnthropic:
             )
             print(f"   Prompt Caching: {'启用' if use_cache else '禁用'}")
 
-            # 初始化对话历史（如果使用缓存，在第一条消息上添加 cache_control）
+            # 初始化对话历史：分析要点作为系统提示的第二块，
+            # 如果使用缓存，在其上添加 cache_control（diff 块的断点已在构建时设置）
+            system = [
+                {"type": "text", "text": system_prompt},
+                {"type": "text", "text": ANALYSIS_RUBRIC},
+            ]
             if use_cache:
-                system = [
-                    {
-                        "type": "text",
-                        "text": system_prompt,
-                        "cache_control": {"type": "ephemeral"},
-                    }
-                ]
-                messages = [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": query,
-                                "cache_control": {"type": "ephemeral"},
-                            }
-                        ],
-                    }
-                ]
-            else:
-                system = [
-                    {
-                        "type": "text",
-                        "text": system_prompt,
-                    }
-                ]
-                messages = [
-                    {
-                        "role": "user",
-                        "content": query,
-                    }
-                ]
+                system[-1]["cache_control"] = {"type": "ephemeral"}
+            messages = [{"role": "user", "content": query_blocks}]
 
             analysis_result = ""
             total_input_tokens = 0
@@ -468,127 +1159,169 @@ class PRAnalysisAnthropic:
             total_cache_read_tokens = 0
             tool_call_count = 0
 
-            print(f"\n=== Claude 分析结果 ===\n")
-
-            # 工具调用循环
-            for round_num in range(max_tool_rounds):
-                stream_params = {
-                    # "model": "claude-sonnet-4-5-20250929",
-                    "model": "glm-4.6",
-                    "max_tokens": max_tokens,
-                    "temperature": temperature,
-                    "system": system,
-                    "messages": messages,
-                }
-
-                # 如果启用工具，添加工具定义
-                if enable_tools:
-                    stream_params["tools"] = get_tool_definitions()
+            # 每轮不变的请求参数只构建一次
+            base_params = {
+                "model": model,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "system": system,
+            }
 
-                # 如果启用缓存，添加必要的 header
+            # 如果启用工具，添加工具定义（启用缓存时在最后一个工具上设置缓存断点）
+            if enable_tools:
+                tools = get_tool_definitions()
                 if use_cache:
-                    stream_params["extra_headers"] = {
-                        "anthropic-beta": "prompt-caching-2024-07-31"
-                    }
-
-                # 使用流式 API
-                with client.messages.stream(**stream_params) as stream:
-                    # 实时打印流式输出
-                    for text in stream.text_stream:
-                        print(text, end="", flush=True)
+                    tools[-1]["cache_control"] = {"type": "ephemeral"}
+                base_params["tools"] = tools
 
-                    # 获取完整响应
-                    response = stream.get_final_message()
+            # 如果启用缓存，添加必要的 header
+            if use_cache:
+                base_params["extra_headers"] = {
+                    "anthropic-beta": "prompt-caching-2024-07-31"
+                }
 
-                    # 更新 token 统计
-                    total_input_tokens += response.usage.input_tokens
-                    total_output_tokens += response.usage.output_tokens
+            # 最近一次带缓存断点的工具结果块（每轮只保留一个，总断点数不超过 4 个）
+            last_cached_tool_result = None
 
-                    # 更新缓存统计（如果有）
-                    if hasattr(response.usage, "cache_creation_input_tokens"):
-                        total_cache_creation_tokens += (
-                            response.usage.cache_creation_input_tokens or 0
-                        )
-                    if hasattr(response.usage, "cache_read_input_tokens"):
-                        total_cache_read_tokens += (
-                            response.usage.cache_read_input_tokens or 0
-                        )
+            print(f"\n=== Claude 分析结果 ===\n")
 
-                    # 检查是否有工具调用
-                    has_tool_use = any(
-                        block.type == "tool_use" for block in response.content
-                    )
+            use_stream = sys.stdout.isatty() if verbose is None else verbose
 
-                    if has_tool_use:
+            # 工具调用循环
+            for round_num in range(max_tool_rounds):
+                request_params = {**base_params, "messages": messages}
+
+                if use_stream:
+                    # 使用流式 API，实时打印流式输出（按块写出）
+                    async with client.messages.stream(**request_params) as stream:
+                        await write_text_stream(stream.text_stream)
+                        response = await stream.get_final_message()
+                else:
+                    # 无需实时输出时使用非流式接口，省去 SSE 事件解析
+                    response = await client.messages.create(**request_params)
+
+                # 更新 token 统计（含缓存统计）
+                round_usage = read_usage(response.usage)
+                total_input_tokens += round_usage.input
+                total_output_tokens += round_usage.output
+                total_cache_creation_tokens += round_usage.cache_create
+                total_cache_read_tokens += round_usage.cache_read
+                logger.debug(
+                    f"第 {round_num + 1} 轮缓存读取: "
+                    f"{round_usage.cache_read:,} tokens"
+                )
+
+                # 检查是否有工具调用
+                has_tool_use = any(
+                    block.type == "tool_use" for block in response.content
+                )
+
+                if has_tool_use:
+                    if use_stream:
                         print()  # 工具调用前换行
-                        # 处理工具调用
-                        tool_results = []
-                        for block in response.content:
-                            if block.type == "tool_use":
-                                tool_call_count += 1
-                                tool_name = block.name
-                                tool_input = block.input
-                                tool_use_id = block.id
-
-                                print(f"🔧 [工具调用 #{tool_call_count}] {tool_name}")
-
-                                # 打印工具参数
-                                if tool_name == "read":
-                                    print(
-                                        f"   📄 读取文件: {tool_input.get('file_path', '')}"
-                                    )
-                                elif tool_name == "glob":
-                                    print(
-                                        f"   📁 查找文件: {tool_input.get('pattern', '')}"
-                                    )
-                                elif tool_name == "grep":
-                                    print(
-                                        f"   🔍 搜索: {tool_input.get('pattern', '')}"
-                                    )
-                                elif tool_name == "git":
-                                    print(
-                                        f"   🌿 Git 命令: {tool_input.get('command', '')}"
-                                    )
-
-                                # 执行工具
-                                tool_result = self._execute_tool(tool_name, tool_input)
-
-                                # 构建工具结果消息
-                                if tool_result.get("success"):
-                                    # 成功的结果
-                                    result_content = json.dumps(
-                                        tool_result, ensure_ascii=False, indent=2
-                                    )
-                                else:
-                                    # 失败的结果
-                                    result_content = (
-                                        f"错误: {tool_result.get('error', '未知错误')}"
-                                    )
-
-                                tool_results.append(
-                                    {
-                                        "type": "tool_result",
-                                        "tool_use_id": tool_use_id,
-                                        "content": result_content,
-                                    }
+                    tool_uses = [
+                        block for block in response.content if block.type == "tool_use"
+                    ]
+
+                    for block in tool_uses:
+                        tool_call_count += 1
+                        tool_name = block.name
+                        tool_input = block.input
+
+                        print(f"🔧 [工具调用 #{tool_call_count}] {tool_name}")
+
+                        # 打印工具参数
+                        if tool_name == "read":
+                            print(f"   📄 读取文件: {tool_input.get('file_path', '')}")
+                        elif tool_name == "glob":
+                            print(f"   📁 查找文件: {tool_input.get('pattern', '')}")
+                        elif tool_name == "grep":
+                            print(f"   🔍 搜索: {tool_input.get('pattern', '')}")
+                        elif tool_name == "git":
+                            print(f"   🌿 Git 命令: {tool_input.get('command', '')}")
+
+                    # 执行工具：同一轮的工具调用相互独立，放到线程池并发执行；
+                    # 含 git 命令时（可能 checkout 切换源码）按顺序执行
+                    if any(block.name == "git" for block in tool_uses):
+                        tool_outputs = [
+                            self._execute_tool(block.name, block.input)
+                            for block in tool_uses
+                        ]
+                    else:
+                        loop = asyncio.get_running_loop()
+                        tool_outputs = await asyncio.gather(
+                            *[
+                                loop.run_in_executor(
+                                    _TOOL_EXECUTOR,
+                                    self._execute_tool,
+                                    block.name,
+                                    block.input,
                                 )
+                                for block in tool_uses
+                            ]
+                        )
 
-                                print(f"   ✓ 执行完成\n")
+                    # 处理工具调用结果（保持与 tool_use 相同的顺序）
+                    tool_results = []
+                    for block, tool_result in zip(tool_uses, tool_outputs):
+                        # 构建工具结果消息
+                        if tool_result.get("success") and block.name == "read":
+                            # 文件内容直接作为文本返回，省去 JSON 转义
+                            result_content = (
+                                f"文件: {tool_result['file_path']} "
+                                f"(偏移 {tool_result['offset']:,} / "
+                                f"共 {tool_result['size']:,} 字节)\n\n"
+                                f"{tool_result['content']}"
+                            )
+                        elif tool_result.get("success"):
+                            # 成功的结果
+                            result_content = orjson.dumps(
+                                tool_result, option=orjson.OPT_INDENT_2
+                            ).decode("utf-8")
+                        else:
+                            # 失败的结果
+                            result_content = (
+                                f"错误: {tool_result.get('error', '未知错误')}"
+                            )
 
-                        # 将 assistant 的响应添加到历史
-                        messages.append(
-                            {"role": "assistant", "content": response.content}
+                        tool_results.append(
+                            {
+                                "type": "tool_result",
+                                "tool_use_id": block.id,
+                                "content": result_content,
+                            }
                         )
 
-                        # 将工具结果添加到历史
-                        messages.append({"role": "user", "content": tool_results})
+                    print(f"   ✓ {len(tool_uses)} 个工具执行完成\n")
+
+                    # 将 assistant 的响应添加到历史（转换为普通 dict，
+                    # 避免后续每轮请求都重新转换 pydantic 内容块）
+                    messages.append(
+                        {
+                            "role": "assistant",
+                            "content": [
+                                block.to_dict(exclude_none=True)
+                                for block in response.content
+                            ],
+                        }
+                    )
 
-                    else:
-                        # 没有工具调用，说明分析完成
-                        for block in response.content:
-                            if hasattr(block, "text"):
-                                analysis_result += block.text
-                        break
+                    # 缓存断点移动到最新的工具结果上，下一轮可复用整个历史前缀
+                    if use_cache and tool_results:
+                        if last_cached_tool_result is not None:
+                            last_cached_tool_result.pop("cache_control", None)
+                        tool_results[-1]["cache_control"] = {"type": "ephemeral"}
+                        last_cached_tool_result = tool_results[-1]
+
+                    # 将工具结果添加到历史
+                    messages.append({"role": "user", "content": tool_results})
+
+                else:
+                    # 没有工具调用，说明分析完成
+                    for block in response.content:
+                        if hasattr(block, "text"):
+                            analysis_result += block.text
+                    break
 
             print(f"\n=== 分析完成 ===\n")
 
@@ -610,17 +1343,44 @@ class PRAnalysisAnthropic:
             if enable_tools:
                 print(f"   工具调用次数: {tool_call_count}")
 
+            # 缓存读取占全部输入 tokens 的比例
+            total_prompt_tokens = (
+                total_input_tokens
+                + total_cache_creation_tokens
+                + total_cache_read_tokens
+            )
+            cache_read_ratio = (
+                total_cache_read_tokens / total_prompt_tokens
+                if total_prompt_tokens
+                else 0.0
+            )
+
+            usage = {
+                "input_tokens": total_input_tokens,
+                "output_tokens": total_output_tokens,
+                "cache_creation_tokens": total_cache_creation_tokens,
+                "cache_read_tokens": total_cache_read_tokens,
+                "cache_read_ratio": round(cache_read_ratio, 4),
+                "tool_calls": tool_call_count,
+            }
+
+            # 写入本地结果缓存，供重复分析时复用
+            if use_result_cache and analysis_result:
+                self.db.save_cached_analysis(
+                    pr_hash,
+                    pr_number,
+                    model,
+                    temperature,
+                    analysis_result,
+                    orjson.dumps(usage).decode("utf-8"),
+                    enable_tools,
+                )
+
             return {
                 "success": True,
                 "pr_number": pr_number,
                 "analysis": analysis_result,
-                "usage": {
-                    "input_tokens": total_input_tokens,
-                    "output_tokens": total_output_tokens,
-                    "cache_creation_tokens": total_cache_creation_tokens,
-                    "cache_read_tokens": total_cache_read_tokens,
-                    "tool_calls": tool_call_count,
-                },
+                "usage": usage,
             }
 
         except Exception as e:
@@ -631,6 +1391,214 @@ class PRAnalysisAnthropic:
             traceback.print_exc()
             return {"success": False, "error": error_msg}
 
+    async def analyze_prs(
+        self,
+        pr_numbers: List[int],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        **kwargs,
+    ) -> List[Dict]:
+        """
+        并发分析多个 PR（支持工具调用），用信号量限制同时进行的请求数
+
+        Args:
+            pr_numbers: PR编号列表
+            max_concurrency: 最大并发分析数（默认 DEFAULT_MAX_CONCURRENCY）
+            **kwargs: 传给 analyze_pr 的其他参数（默认 verbose=False，避免并发输出交错）
+
+        Returns:
+            每个 PR 的分析结果列表，顺序与 pr_numbers 一致
+        """
+        kwargs.setdefault("verbose", False)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def analyze_one(pr_number: int) -> Dict:
+            async with semaphore:
+                return await self.analyze_pr(pr_number=pr_number, **kwargs)
+
+        return await asyncio.gather(
+            *[analyze_one(pr_number) for pr_number in pr_numbers]
+        )
+
+    async def analyze_prs_batch(
+        self,
+        pr_numbers: Optional[List[int]] = None,
+        max_tokens: int = 16384,
+        temperature: float = 0.3,
+        poll_interval: int = 30,
+        use_result_cache: bool = True,
+    ) -> List[Dict]:
+        """
+        使用 Message Batches API 批量分析多个 PR（不支持工具调用）
+
+        所有请求使用相同的带 cache_control 的系统提示，服务端只需写入一次缓存。
+        适用于定时任务或历史数据回填等非交互场景，结果写回分析缓存表。
+
+        批处理不支持工具调用，每个请求与 analyze_pr(enable_tools=False, filter_diff=False)
+        使用相同的参数（包括按 diff 大小选择的模型），缓存键也相同：回填的结果只会被
+        这种调用命中，默认启用工具的 analyze_pr 仍会重新分析。相应地，自动选取 PR 时
+        只排除已有不启用工具分析结果的 PR。
+
+        Args:
+            pr_numbers: PR编号列表，为 None 时从数据库选取尚无不启用工具分析结果的 PR
+                        （最多 MAX_BATCH_REQUESTS 个）
+            max_tokens: 最大输出 tokens（默认 16384）
+            temperature: 温度参数（默认 0.3）
+            poll_interval: 轮询批处理状态的间隔秒数（默认 30）
+            use_result_cache: 是否复用本地缓存的分析结果（默认 True）
+
+        Returns:
+            每个 PR 的分析结果列表，格式与 analyze_pr 的返回值一致
+        """
+        if pr_numbers is None:
+            pr_numbers = self.db.get_unanalyzed_pr_numbers(
+                MAX_BATCH_REQUESTS, enable_tools=False
+            )
+            logger.info(f"📋 从数据库选取 {len(pr_numbers)} 个待分析的 PR")
+
+        results = {}
+        requests = []
+        pr_hashes = {}
+        pr_models = {}
+
+        for pr_number in pr_numbers:
+            target_pr = self.get_pr_by_number(pr_number)
+            if not target_pr:
+                results[pr_number] = {
+                    "success": False,
+                    "error": f"未找到编号为 {pr_number} 的PR",
+                }
+                continue
+
+            diff_content = target_pr.get("diff_content", "")
+            model = select_analysis_model(diff_content)
+            pr_hash = build_analysis_cache_key(
+                pr_number,
+                diff_content,
+                NO_TOOL_SYSTEM_PROMPT + ANALYSIS_RUBRIC,
+                model,
+                temperature,
+                max_tokens,
+                filter_diff=False,  # 批处理不预过滤 diff
+            )
+            if use_result_cache:
+                cached = self.db.get_cached_analysis(pr_hash)
+                if cached:
+                    logger.info(f"♻️ PR #{pr_number} 命中本地分析缓存，跳过批处理")
+                    results[pr_number] = {
+                        "success": True,
+                        "pr_number": pr_number,
+                        "analysis": cached["analysis"],
+                        "usage": orjson.loads(cached["usage_info"] or "{}"),
+                        "cached": True,
+                    }
+                    continue
+
+            pr_hashes[pr_number] = pr_hash
+            pr_models[pr_number] = model
+            requests.append(
+                {
+                    "custom_id": f"pr_{pr_number}",
+                    "params": {
+                        "model": model,
+                        "max_tokens": max_tokens,
+                        "temperature": temperature,
+                        "system": [
+                            {"type": "text", "text": NO_TOOL_SYSTEM_PROMPT},
+                            {
+                                "type": "text",
+                                "text": ANALYSIS_RUBRIC,
+                                "cache_control": {"type": "ephemeral"},
+                            },
+                        ],
+                        "messages": [
+                            {
+                                "role": "user",
+                                "content": build_analysis_blocks(
+                                    target_pr, trim_diff_content(diff_content)
+                                ),
+                            }
+                        ],
+                    },
+                }
+            )
+
+        client = get_async_anthropic_client() if requests else None
+        # 单个批处理最多 MAX_BATCH_REQUESTS 个请求，超出时拆分提交
+        for offset in range(0, len(requests), MAX_BATCH_REQUESTS):
+            chunk = requests[offset : offset + MAX_BATCH_REQUESTS]
+            try:
+                batch = await client.messages.batches.create(requests=chunk)
+                logger.info(f"📦 已提交批处理 {batch.id}，包含 {len(chunk)} 个 PR")
+
+                # 轮询直到批处理结束
+                while batch.processing_status != "ended":
+                    await asyncio.sleep(poll_interval)
+                    batch = await client.messages.batches.retrieve(batch.id)
+                    counts = batch.request_counts
+                    logger.info(
+                        f"⏳ 批处理 {batch.id}: 处理中 {counts.processing}, "
+                        f"成功 {counts.succeeded}, 失败 {counts.errored}"
+                    )
+
+                # 本批结果汇总后一次性写入缓存表
+                cache_rows = []
+                async for entry in await client.messages.batches.results(batch.id):
+                    pr_number = int(entry.custom_id[len("pr_") :])
+                    if entry.result.type != "succeeded":
+                        results[pr_number] = {
+                            "success": False,
+                            "error": f"批处理请求未成功: {entry.result.type}",
+                        }
+                        continue
+
+                    message = entry.result.message
+                    analysis = "".join(
+                        block.text for block in message.content if block.type == "text"
+                    )
+                    usage_info = read_usage(message.usage)
+                    usage = {
+                        "input_tokens": usage_info.input,
+                        "output_tokens": usage_info.output,
+                        "cache_creation_tokens": usage_info.cache_create,
+                        "cache_read_tokens": usage_info.cache_read,
+                        "tool_calls": 0,
+                    }
+                    if use_result_cache and analysis:
+                        cache_rows.append(
+                            (
+                                pr_hashes[pr_number],
+                                pr_number,
+                                pr_models[pr_number],
+                                temperature,
+                                analysis,
+                                orjson.dumps(usage).decode("utf-8"),
+                                False,
+                            )
+                        )
+                    results[pr_number] = {
+                        "success": True,
+                        "pr_number": pr_number,
+                        "analysis": analysis,
+                        "usage": usage,
+                    }
+                self.db.save_cached_analyses(cache_rows)
+
+            except Exception as e:
+                error_msg = f"批处理分析出错: {str(e)}"
+                logger.error(f"❌ {error_msg}")
+                for request in chunk:
+                    results.setdefault(
+                        int(request["custom_id"][len("pr_") :]),
+                        {"success": False, "error": error_msg},
+                    )
+
+        return [
+            results.get(
+                pr_number, {"success": False, "error": f"PR #{pr_number} 无批处理结果"}
+            )
+            for pr_number in pr_numbers
+        ]
+
     def close(self):
         """
         关闭数据库连接
@@ -686,7 +1654,9 @@ async def main():
         traceback.print_exc()
     finally:
         analyzer.close()
+        await close_async_anthropic_client()
 
 
 if __name__ == "__main__":
+    install_event_loop()
     asyncio.run(main())
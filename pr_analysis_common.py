@@ -1,12 +1,88 @@
-import json
-from typing import Dict, Optional
+import io
+import re
+import shutil
+import string
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
 
-from database import DatabaseManager
+import orjson
+
+try:
+    import tiktoken
+
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+from database import DB_EXECUTOR_WORKERS, DatabaseManager
 from logger_config import setup_logger
 
 logger = setup_logger(__name__)
 
+# diff 超过该字符数时分块从数据库读取
+DIFF_CHUNK_SIZE = 65536
+
+# 与主查询并发执行评论查询的线程池（每个任务使用独立的连接池连接）
+_DB_EXECUTOR = ThreadPoolExecutor(
+    max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="pr-db"
+)
+
+# 进程内 PR 数据 LRU 缓存（pr_number -> (过期时间, 估算大小, PR 数据)），
+# 重复分析同一个 PR 时不再查询数据库。总大小按字符数估算（diff 可能有数 MB），
+# 条目超过 PR_CACHE_TTL 秒后重新查询，以便看到其他进程重新抓取的数据
+PR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PR_CACHE_TTL = 600
+_PR_CACHE: "OrderedDict[int, Tuple[float, int, Dict]]" = OrderedDict()
+_PR_CACHE_BYTES = 0
+_PR_CACHE_LOCK = threading.Lock()
+
+# diff 估算 token 数超过该值时进行裁剪
+MAX_DIFF_TOKENS = 150000
+# 裁剪时每个文件保留的 hunk 数
+MAX_HUNKS_PER_FILE = 3
+# 超过该行数的 hunk 只保留首尾各 HUNK_KEEP_LINES 行
+MAX_HUNK_LINES = 200
+HUNK_KEEP_LINES = 20
+
+# git 工具允许的子命令（只读 + checkout）
+SAFE_GIT_COMMANDS = frozenset(
+    {
+        "checkout",
+        "status",
+        "log",
+        "show",
+        "diff",
+        "branch",
+        "rev-parse",
+        "ls-tree",
+        "ls-files",
+    }
+)
+SAFE_GIT_COMMANDS_TEXT = ", ".join(sorted(SAFE_GIT_COMMANDS))
+
+# git 工具禁止的危险子命令
+DANGEROUS_GIT_COMMANDS = frozenset(
+    {
+        "push",
+        "reset",
+        "clean",
+        "rm",
+        "commit",
+        "rebase",
+        "merge",
+        "pull",
+        "fetch",
+        "add",
+    }
+)
+
+# git 命令中禁止的管道、重定向、命令链接等 shell 操作符（|, ||, >, >>, <, &&, ;）
+SHELL_OPERATOR_RE = re.compile(r"[|<>;]|&&")
+
 
 def get_tool_system_prompt() -> str:
     """
@@ -38,29 +114,7 @@ IoTDB PR分析工作流：
     return base_prompt + workflow_prompt
 
 
-def build_analysis_query(pr_data: Dict, diff_content: str) -> str:
-    """
-    构建完整的一次性PR分析查询（用于小型diff）
-
-    Args:
-        pr_data: PR数据
-        diff_content: 完整的diff内容
-    """
-    # 构建评论部分
-    if pr_data.get("comments"):
-        comments_section = "- PR 讨论评论\n"
-        for idx, comment in enumerate(pr_data["comments"], 1):
-            comment_time = comment.get("created_at", "")
-            comment_user = comment.get("user", "未知用户")
-            comment_body = comment.get("body", "")
-            comments_section += f"""  评论 {idx} (作者: {comment_user}, 时间: {comment_time}):
-{comment_body}
----
-"""
-    else:
-        comments_section = "- PR 讨论评论: 无\n"
-
-    template = """
+_PR_INFO_TEMPLATE = """
 IoTDB PR详细信息：
 - 编号: {number}
 - 标题: {title}
@@ -73,12 +127,27 @@ IoTDB PR详细信息：
 - 代码变更: +{additions} 行, -{deletions} 行
 - 分支: {head} -> {base}
 - Diff链接: {diff_url}
-{comments_section}
+{comments_section}"""
+
+_QUERY_HEADER_TEMPLATE = _PR_INFO_TEMPLATE + """
 
 这是一个IoTDB的Pull Request，请先阅读上述基本信息。接下来是代码变更的diff内容：
 
 ```diff
-{diff_content}
+"""
+
+# 深入分析要点（分块查询时放入系统提示，作为可缓存的静态前缀）
+ANALYSIS_RUBRIC = """**请进行深入分析：**
+1. 这个PR具体解决了什么技术问题？
+2. 如果客户环境没有这个修复，系统可能出现什么具体错误？
+3. 可能出现的错误信息、异常堆栈或日志是什么？
+4. 对系统稳定性、性能和功能的影响程度？
+5. 建议的临时解决方案或规避措施？
+6. 推荐的升级优先级？
+
+请提供详细、结构化的分析结果。"""
+
+_QUERY_FOOTER = """
 ```
 
 现在你已经收到了完整的PR信息（包括基本信息和diff内容）。
@@ -93,27 +162,391 @@ IoTDB PR详细信息：
 
 请提供详细、结构化的分析结果。"""
 
-    return template.format(
-        number=pr_data.get("number", ""),
-        title=pr_data.get("title", ""),
-        body=pr_data.get("body", "无描述"),
-        created_at=pr_data.get("created_at", ""),
-        merged_at=pr_data.get("merged_at", ""),
-        merge_commit=pr_data.get("merge_commit", "无"),
-        user=pr_data.get("user", ""),
-        labels=json.dumps(pr_data.get("labels", []), ensure_ascii=False),
-        additions=pr_data.get("additions", 0),
-        deletions=pr_data.get("deletions", 0),
-        head=pr_data.get("head", ""),
-        base=pr_data.get("base", ""),
-        comments_section=comments_section,
-        diff_url=pr_data.get("diff_url", "无"),
-        diff_content=diff_content if diff_content else "无代码变更",
+_DIFF_BLOCK_HEADER = """这是一个IoTDB的Pull Request的代码变更diff内容，PR基本信息附在diff之后：
+
+```diff
+"""
+
+_PR_INFO_FOOTER = """
+
+现在你已经收到了完整的PR信息（包括diff内容和基本信息），请按照系统提示中的要点进行分析。"""
+
+
+_COMMENTS_HEADER = "- PR 讨论评论\n"
+_NO_COMMENTS_SECTION = "- PR 讨论评论: 无\n"
+_COMMENT_FMT = "  评论 {idx} (作者: {user}, 时间: {time}):\n{body}\n---\n"
+
+
+def _parse_template(template: str):
+    """模板只在导入时解析一次：[(字面文本, 字段名或 None), ...]"""
+    return [
+        (literal, field_name)
+        for literal, field_name, _, _ in string.Formatter().parse(template)
+    ]
+
+
+_QUERY_HEADER_PARTS = _parse_template(_QUERY_HEADER_TEMPLATE)
+_PR_INFO_PARTS = _parse_template(_PR_INFO_TEMPLATE)
+
+
+def _get_pr_fields(pr_data: Dict) -> Dict:
+    """
+    提取填充PR信息模板所需的字段
+
+    Args:
+        pr_data: PR数据
+    """
+    # 构建评论部分：逐条格式化后一次性拼接，没有评论时直接使用常量
+    comments = pr_data.get("comments")
+    if comments:
+        parts = [_COMMENTS_HEADER]
+        for idx, comment in enumerate(comments, 1):
+            parts.append(
+                _COMMENT_FMT.format(
+                    idx=idx,
+                    user=comment.get("user", "未知用户"),
+                    time=comment.get("created_at", ""),
+                    body=comment.get("body", ""),
+                )
+            )
+        comments_section = "".join(parts)
+    else:
+        comments_section = _NO_COMMENTS_SECTION
+
+    return {
+        "number": pr_data.get("number", ""),
+        "title": pr_data.get("title", ""),
+        "body": pr_data.get("body", "无描述"),
+        "created_at": pr_data.get("created_at", ""),
+        "merged_at": pr_data.get("merged_at", ""),
+        "merge_commit": pr_data.get("merge_commit", "无"),
+        "user": pr_data.get("user", ""),
+        "labels": orjson.dumps(pr_data.get("labels", [])).decode("utf-8"),
+        "additions": pr_data.get("additions", 0),
+        "deletions": pr_data.get("deletions", 0),
+        "head": pr_data.get("head", ""),
+        "base": pr_data.get("base", ""),
+        "comments_section": comments_section,
+        "diff_url": pr_data.get("diff_url", "无"),
+    }
+
+
+def _write_template(out: IO[str], parts, fields: Dict) -> None:
+    """按预解析的模板片段把字段写入缓冲区"""
+    for literal, field_name in parts:
+        out.write(literal)
+        if field_name is not None:
+            out.write(str(fields[field_name]))
+
+
+def _write_diff(out: IO[str], diff_content: Optional[Union[str, IO[str]]]) -> None:
+    """把 diff 写入缓冲区；diff 不经过 str.format，避免额外拷贝"""
+    if hasattr(diff_content, "read"):
+        shutil.copyfileobj(diff_content, out)
+    else:
+        out.write(diff_content if diff_content else "无代码变更")
+
+
+def build_analysis_query(
+    pr_data: Dict, diff_content: Optional[Union[str, IO[str]]]
+) -> str:
+    """
+    构建完整的一次性PR分析查询（用于小型diff）
+
+    Args:
+        pr_data: PR数据
+        diff_content: 完整的diff内容，也可以是可读的文本流
+    """
+    out = io.StringIO()
+    _write_template(out, _QUERY_HEADER_PARTS, _get_pr_fields(pr_data))
+    _write_diff(out, diff_content)
+    out.write(_QUERY_FOOTER)
+    return out.getvalue()
+
+
+def build_analysis_blocks(
+    pr_data: Dict,
+    diff_content: Optional[Union[str, IO[str]]],
+    use_cache: bool = True,
+) -> List[Dict]:
+    """
+    构建分块的PR分析查询（用于 Anthropic Messages API 的 content 数组）
+
+    diff 放在前面并设置缓存断点，重新分析同一个PR时可直接命中缓存；
+    PR基本信息和评论放在最后，不参与缓存。diff 单独成块，字符串不再拼接拷贝。
+    分析要点见 ANALYSIS_RUBRIC，应放入系统提示。
+
+    Args:
+        pr_data: PR数据
+        diff_content: 完整的diff内容，也可以是可读的文本流
+        use_cache: 是否在 diff 块上设置 cache_control
+
+    Returns:
+        文本块列表
+    """
+    if hasattr(diff_content, "read"):
+        diff_content = diff_content.read()
+    diff_block = {"type": "text", "text": diff_content or "无代码变更"}
+    if use_cache:
+        diff_block["cache_control"] = {"type": "ephemeral"}
+
+    info_out = io.StringIO()
+    info_out.write("\n```\n")
+    _write_template(info_out, _PR_INFO_PARTS, _get_pr_fields(pr_data))
+    info_out.write(_PR_INFO_FOOTER)
+
+    return [
+        {"type": "text", "text": _DIFF_BLOCK_HEADER},
+        diff_block,
+        {"type": "text", "text": info_out.getvalue()},
+    ]
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    估算文本的 token 数（安装了 tiktoken 时使用 cl100k_base 编码近似，否则按 4 字符/token）
+
+    Args:
+        text: 待估算的文本
+    """
+    if not text:
+        return 0
+    if TIKTOKEN_AVAILABLE:
+        return len(_get_tiktoken_encoding().encode(text, disallowed_special=()))
+    return len(text) // 4
+
+
+_TIKTOKEN_ENCODING = None
+
+
+def _get_tiktoken_encoding():
+    global _TIKTOKEN_ENCODING
+    if _TIKTOKEN_ENCODING is None:
+        _TIKTOKEN_ENCODING = tiktoken.get_encoding("cl100k_base")
+    return _TIKTOKEN_ENCODING
+
+
+def _trim_hunk(hunk_lines: List[str]) -> List[str]:
+    """
+    折叠超长 hunk：保留 @@ 头以及首尾各 HUNK_KEEP_LINES 行
+    """
+    body = hunk_lines[1:]
+    if len(body) <= MAX_HUNK_LINES:
+        return hunk_lines
+    elided = len(body) - 2 * HUNK_KEEP_LINES
+    return (
+        hunk_lines[:1]
+        + body[:HUNK_KEEP_LINES]
+        + [f"[... 省略 {elided} 行 ...]"]
+        + body[-HUNK_KEEP_LINES:]
     )
 
 
+def _trim_file_diff(file_lines: List[str]) -> List[str]:
+    """
+    裁剪单个文件的 diff：保留文件头和前 MAX_HUNKS_PER_FILE 个 hunk
+    """
+    header = []
+    hunks = []
+    for line in file_lines:
+        if line.startswith("@@"):
+            hunks.append([line])
+        elif hunks:
+            hunks[-1].append(line)
+        else:
+            header.append(line)
+
+    trimmed = header
+    for hunk in hunks[:MAX_HUNKS_PER_FILE]:
+        trimmed.extend(_trim_hunk(hunk))
+    if len(hunks) > MAX_HUNKS_PER_FILE:
+        trimmed.append(f"[... 省略 {len(hunks) - MAX_HUNKS_PER_FILE} 个 hunk ...]")
+    return trimmed
+
+
+# 行首的 "diff --git"（行分隔符与 str.splitlines 一致），即每个文件 diff 的起点
+_FILE_DIFF_START_RE = re.compile(
+    r"(?<=[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029])diff --git"
+)
+
+
+def _iter_file_diffs(diff_content: str) -> Iterator[List[str]]:
+    """
+    逐个文件产出 diff 的行列表，只切分当前文件，不一次性展开整个 diff
+    """
+    start = 0
+    for match in _FILE_DIFF_START_RE.finditer(diff_content):
+        yield diff_content[start : match.start()].splitlines()
+        start = match.start()
+    yield diff_content[start:].splitlines()
+
+
+def trim_diff_content(
+    diff_content: Optional[str], max_tokens: int = MAX_DIFF_TOKENS
+) -> Optional[str]:
+    """
+    diff 过大时进行裁剪，避免超出模型上下文窗口
+
+    每个文件保留 diff --git 等文件头和前 MAX_HUNKS_PER_FILE 个 hunk，
+    超过 MAX_HUNK_LINES 行的 hunk 只保留首尾各 HUNK_KEEP_LINES 行
+
+    Args:
+        diff_content: 原始 diff 内容
+        max_tokens: 估算 token 数上限，未超过时原样返回
+
+    Returns:
+        裁剪后的 diff 内容
+    """
+    if not diff_content or estimate_tokens(diff_content) <= max_tokens:
+        return diff_content
+
+    trimmed = []
+    for file_lines in _iter_file_diffs(diff_content):
+        trimmed.extend(_trim_file_diff(file_lines))
+
+    result = "\n".join(trimmed)
+    logger.info(
+        f"✂️ Diff 已裁剪: {len(diff_content):,} -> {len(result):,} 字符 "
+        f"(~{estimate_tokens(result):,} tokens)"
+    )
+    return result
+
+
+def _fetch_diff_chunks(cursor, diff_id: int, diff_size: int) -> str:
+    """
+    按 DIFF_CHUNK_SIZE 分块读取大diff的内容
+
+    Args:
+        cursor: 字典游标
+        diff_id: pr_diffs 表中的记录 id
+        diff_size: diff 的字符数
+    """
+    chunk_query = """
+    SELECT SUBSTRING(COALESCE(d.diff_content, c.diff_content), %s, %s) AS chunk
+    FROM pr_diffs d
+    LEFT JOIN pr_diff_contents c ON c.sha1 = d.diff_sha1
+    WHERE d.id = %s
+    """
+    buffer = io.StringIO()
+    for offset in range(1, diff_size + 1, DIFF_CHUNK_SIZE):
+        cursor.execute(chunk_query, (offset, DIFF_CHUNK_SIZE, diff_id))
+        buffer.write(cursor.fetchone()["chunk"])
+    return buffer.getvalue()
+
+
+# PR 基本信息连同最新 diff 的 id、大小一起查询；小 diff 的内容也直接带回，
+# 大 diff 再按块读取。diff 内容按 SHA-1 去重保存在 pr_diff_contents 中，
+# 旧数据仍在 pr_diffs.diff_content 中
+_PR_WITH_DIFF_SELECT = """
+SELECT p.number, p.title, p.body, p.created_at, p.merged_at, p.user, p.labels,
+       p.head, p.base, p.additions, p.deletions, p.diff_url, p.comments_url,
+       p.merge_commit,
+       d.id AS diff_id,
+       CHAR_LENGTH(COALESCE(d.diff_content, c.diff_content)) AS diff_size,
+       IF(CHAR_LENGTH(COALESCE(d.diff_content, c.diff_content)) <= %s,
+          COALESCE(d.diff_content, c.diff_content), NULL) AS diff_inline
+FROM iotdb_prs p
+LEFT JOIN pr_diffs d ON d.id = (
+    SELECT id FROM pr_diffs
+    WHERE pr_number = p.number
+    ORDER BY created_at DESC
+    LIMIT 1
+)
+LEFT JOIN pr_diff_contents c ON c.sha1 = d.diff_sha1
+"""
+
+
+_COMMENTS_SELECT = """
+SELECT user, body, created_at
+FROM pr_comments
+WHERE pr_number = %s
+ORDER BY created_at ASC
+"""
+
+
+def _fetch_comments(db: DatabaseManager, pr_number: int) -> List[Dict]:
+    """
+    使用连接池中的独立连接查询PR的评论（可在其他线程中执行）
+
+    Args:
+        db: DatabaseManager实例
+        pr_number: PR编号
+    """
+    with db.acquire() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(_COMMENTS_SELECT, (pr_number,))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+def _estimate_pr_size(pr: Dict) -> int:
+    """估算 PR 数据占用的大小（字符串字段和评论内容的字符数）"""
+    size = sum(len(value) for value in pr.values() if isinstance(value, str))
+    size += sum(len(comment.get("body") or "") for comment in pr.get("comments") or ())
+    return size
+
+
+def _get_cached_pr(pr_number: int) -> Optional[Dict]:
+    """从缓存获取未过期的 PR 数据"""
+    global _PR_CACHE_BYTES
+    with _PR_CACHE_LOCK:
+        entry = _PR_CACHE.get(pr_number)
+        if entry is None:
+            return None
+        expires_at, size, pr = entry
+        if expires_at <= time.monotonic():
+            del _PR_CACHE[pr_number]
+            _PR_CACHE_BYTES -= size
+            return None
+        _PR_CACHE.move_to_end(pr_number)
+        return dict(pr)
+
+
+def _cache_pr(pr_number: int, pr: Dict) -> None:
+    """缓存 PR 数据，总大小超过 PR_CACHE_MAX_BYTES 时淘汰最久未使用的条目"""
+    global _PR_CACHE_BYTES
+    size = _estimate_pr_size(pr)
+    if size > PR_CACHE_MAX_BYTES:
+        return
+    with _PR_CACHE_LOCK:
+        old = _PR_CACHE.pop(pr_number, None)
+        if old is not None:
+            _PR_CACHE_BYTES -= old[1]
+        _PR_CACHE[pr_number] = (time.monotonic() + PR_CACHE_TTL, size, pr)
+        _PR_CACHE_BYTES += size
+        while _PR_CACHE_BYTES > PR_CACHE_MAX_BYTES:
+            _, (_, evicted_size, _) = _PR_CACHE.popitem(last=False)
+            _PR_CACHE_BYTES -= evicted_size
+
+
+def invalidate_pr_cache(pr_numbers: Iterable[int]) -> None:
+    """
+    从进程内缓存中移除指定 PR（数据库中的这些 PR 被重新写入后调用）
+    """
+    global _PR_CACHE_BYTES
+    with _PR_CACHE_LOCK:
+        for pr_number in pr_numbers:
+            entry = _PR_CACHE.pop(pr_number, None)
+            if entry is not None:
+                _PR_CACHE_BYTES -= entry[1]
+
+
+def clear_pr_cache() -> None:
+    """
+    清空进程内的 PR 数据缓存（数据库中的 PR 被更新后调用）
+    """
+    global _PR_CACHE_BYTES
+    with _PR_CACHE_LOCK:
+        _PR_CACHE.clear()
+        _PR_CACHE_BYTES = 0
+
+
 def get_pr_by_number(
-    pr_number: Optional[int] = None, db: Optional[DatabaseManager] = None
+    pr_number: Optional[int] = None,
+    db: Optional[DatabaseManager] = None,
+    use_cache: bool = True,
 ) -> Optional[Dict]:
     """
     从数据库获取指定PR的数据，如果没有指定编号则获取最新的PR
@@ -121,33 +554,33 @@ def get_pr_by_number(
     Args:
         pr_number: PR编号
         db: DatabaseManager实例，如果不提供则内部创建（仅用于兼容性）
+        use_cache: 是否使用进程内 LRU 缓存（默认 True，仅对指定编号的查询生效）
     """
+    if pr_number and use_cache:
+        cached = _get_cached_pr(pr_number)
+        if cached is not None:
+            return cached
+
     if db is None:
         db = DatabaseManager()
         should_close = True
     else:
         should_close = False
 
+    comments_future = None
     try:
+        # 已知PR编号时，评论查询使用另一个连接与主查询并发执行
+        if pr_number:
+            comments_future = _DB_EXECUTOR.submit(_fetch_comments, db, pr_number)
+
         cursor = db.connection.cursor(dictionary=True)
 
         if pr_number:
-            query = """
-            SELECT number, title, body, created_at, merged_at, user, labels,
-                   head, base, additions, deletions, diff_url, comments_url, merge_commit
-            FROM iotdb_prs
-            WHERE number = %s
-            """
-            cursor.execute(query, (pr_number,))
+            query = _PR_WITH_DIFF_SELECT + "WHERE p.number = %s"
+            cursor.execute(query, (DIFF_CHUNK_SIZE, pr_number))
         else:
-            query = """
-            SELECT number, title, body, created_at, merged_at, user, labels,
-                   head, base, additions, deletions, diff_url, comments_url, merge_commit
-            FROM iotdb_prs
-            ORDER BY merged_at DESC
-            LIMIT 1
-            """
-            cursor.execute(query)
+            query = _PR_WITH_DIFF_SELECT + "ORDER BY p.merged_at DESC LIMIT 1"
+            cursor.execute(query, (DIFF_CHUNK_SIZE,))
 
         pr = cursor.fetchone()
 
@@ -155,46 +588,40 @@ def get_pr_by_number(
             # 解析JSON格式的labels
             if pr["labels"]:
                 try:
-                    pr["labels"] = json.loads(pr["labels"])
-                except (json.JSONDecodeError, TypeError):
+                    pr["labels"] = orjson.loads(pr["labels"])
+                except (orjson.JSONDecodeError, TypeError):
                     pr["labels"] = []
             else:
                 pr["labels"] = []
 
             # 获取对应的diff内容
-            diff_query = """
-            SELECT diff_content
-            FROM pr_diffs
-            WHERE pr_number = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-            """
-            cursor.execute(diff_query, (pr["number"],))
-            diff_result = cursor.fetchone()
-
-            if diff_result and diff_result["diff_content"]:
-                pr["diff_content"] = diff_result["diff_content"]
-            else:
+            diff_id = pr.pop("diff_id")
+            diff_size = pr.pop("diff_size")
+            diff_inline = pr.pop("diff_inline")
+            if not diff_size:
                 pr["diff_content"] = None
+            elif diff_inline is not None:
+                pr["diff_content"] = diff_inline
+            else:
+                pr["diff_content"] = _fetch_diff_chunks(cursor, diff_id, diff_size)
 
             # 获取对应的评论内容
-            comments_query = """
-            SELECT id, user, body, created_at, updated_at, html_url
-            FROM pr_comments
-            WHERE pr_number = %s
-            ORDER BY created_at ASC
-            """
-            cursor.execute(comments_query, (pr["number"],))
-            comments_results = cursor.fetchall()
-
-            if comments_results:
-                pr["comments"] = comments_results
+            if comments_future is not None:
+                comments_results = comments_future.result()
             else:
-                pr["comments"] = []
+                comments_results = _fetch_comments(db, pr["number"])
+            pr["comments"] = comments_results or []
+        elif comments_future is not None:
+            # PR 不存在时也等待评论查询结束，再关闭数据库连接
+            comments_future.result()
 
         cursor.close()
         if should_close:
             db.close()
+
+        if pr and pr_number and use_cache:
+            _cache_pr(pr_number, pr)
+            return dict(pr)
         return pr
 
     except Exception as e:
@@ -7,6 +7,7 @@ import asyncio
 import json
 import subprocess
 import fnmatch
+import re
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Any
@@ -18,15 +19,38 @@ from logger_config import setup_logger
 logger = setup_logger(__name__)
 from langchain.tools import BaseTool, StructuredTool
 from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import SystemMessage
 from langchain.callbacks.base import BaseCallbackHandler
 from pydantic import BaseModel, Field
 
 from config import ANTHROPIC_BASE_URL, ANTHROPIC_API_KEY, DEFAULT_IOTDB_SOURCE_DIR
 from database import DatabaseManager
 from pr_analysis_common import (
+    DANGEROUS_GIT_COMMANDS,
+    SAFE_GIT_COMMANDS,
+    SAFE_GIT_COMMANDS_TEXT,
+    SHELL_OPERATOR_RE,
     build_analysis_query,
     get_pr_by_number,
     get_tool_system_prompt,
+    trim_diff_content,
+)
+
+# 防止命令注入的危险模式，编译为一个正则一次扫描
+_DANGEROUS_PATTERN_RE = re.compile(
+    "|".join(
+        re.escape(pattern)
+        for pattern in (
+            ";rm ",
+            ";curl ",
+            ";wget ",
+            "&&rm ",
+            "$(curl",
+            "`curl",
+            ";sh ",
+            ";bash ",
+        )
+    )
 )
 
 
@@ -60,8 +84,13 @@ class ThinkingCallbackHandler(BaseCallbackHandler):
             self.thinking_text += str(token)
 
     def on_llm_end(self, response: Any, **kwargs: Any) -> None:
-        """LLM 结束时调用"""
-        pass
+        """LLM 结束时记录本轮的缓存命中情况"""
+        usage = (getattr(response, "llm_output", None) or {}).get("usage") or {}
+        if isinstance(usage, dict) and "cache_read_input_tokens" in usage:
+            logger.debug(
+                f"缓存读取: {usage.get('cache_read_input_tokens') or 0:,} tokens, "
+                f"缓存写入: {usage.get('cache_creation_input_tokens') or 0:,} tokens"
+            )
 
     def on_tool_start(
         self, serialized: Dict[str, Any], input_str: str, **kwargs: Any
@@ -505,11 +534,11 @@ class PRAnalysisLangChain:
                     return "错误: 只允许 git 命令"
 
                 # 检查是否包含管道或重定向操作符
-                shell_operators = ["|", ">", ">>", "<", "&&", "||", ";"]
-                for operator in shell_operators:
-                    if operator in cmd_stripped:
-                        logger.error(f"❌ Git 命令不允许包含 shell 操作符 '{operator}'")
-                        return f"错误: Git 命令不允许包含 shell 操作符 '{operator}'。请使用纯 git 命令。"
+                operator_match = SHELL_OPERATOR_RE.search(cmd_stripped)
+                if operator_match:
+                    operator = operator_match.group()
+                    logger.error(f"❌ Git 命令不允许包含 shell 操作符 '{operator}'")
+                    return f"错误: Git 命令不允许包含 shell 操作符 '{operator}'。请使用纯 git 命令。"
 
                 # 解析 git 命令
                 cmd_parts = cmd_stripped.split()
@@ -519,58 +548,20 @@ class PRAnalysisLangChain:
 
                 git_subcmd = cmd_parts[1].lower()
 
-                # 允许的安全 git 命令（只读 + checkout）
-                safe_git_commands = {
-                    "checkout",
-                    "status",
-                    "log",
-                    "show",
-                    "diff",
-                    "branch",
-                    "rev-parse",
-                    "ls-tree",
-                    "ls-files",
-                }
-
-                # 危险命令黑名单
-                dangerous_git_commands = {
-                    "push",
-                    "reset",
-                    "clean",
-                    "rm",
-                    "commit",
-                    "rebase",
-                    "merge",
-                    "pull",
-                    "fetch",
-                    "add",
-                }
-
-                if git_subcmd in dangerous_git_commands:
+                if git_subcmd in DANGEROUS_GIT_COMMANDS:
                     logger.error(f"❌ 禁止执行危险的 git 命令: git {git_subcmd}")
                     return f"错误: 禁止执行危险的 git 命令: git {git_subcmd}"
 
-                if git_subcmd not in safe_git_commands:
-                    allowed_list = ", ".join(sorted(safe_git_commands))
+                if git_subcmd not in SAFE_GIT_COMMANDS:
                     logger.error(f"❌ Git 命令 '{git_subcmd}' 不在允许列表中")
-                    return f"错误: Git 命令 '{git_subcmd}' 不在允许列表中（允许: {allowed_list}）"
+                    return f"错误: Git 命令 '{git_subcmd}' 不在允许列表中（允许: {SAFE_GIT_COMMANDS_TEXT}）"
 
                 # 额外的安全检查：防止命令注入
-                dangerous_patterns = [
-                    ";rm ",
-                    ";curl ",
-                    ";wget ",
-                    "&&rm ",
-                    "$(curl",
-                    "`curl",
-                    ";sh ",
-                    ";bash ",
-                ]
-                cmd_lower = cmd_stripped.lower()
-                for pattern in dangerous_patterns:
-                    if pattern in cmd_lower:
-                        logger.error(f"❌ 检测到危险模式: {pattern}")
-                        return f"错误: 检测到危险模式: {pattern}"
+                pattern_match = _DANGEROUS_PATTERN_RE.search(cmd_stripped.lower())
+                if pattern_match:
+                    pattern = pattern_match.group()
+                    logger.error(f"❌ 检测到危险模式: {pattern}")
+                    return f"错误: 检测到危险模式: {pattern}"
 
                 # 使用 shell=False 执行命令（禁用管道、重定向等）
                 result = subprocess.run(
@@ -690,7 +681,9 @@ class PRAnalysisLangChain:
             )
 
             # 构建分析提示（使用 pr_analysis_common 中的函数）
-            analysis_prompt = build_analysis_query(target_pr, diff_content)
+            analysis_prompt = build_analysis_query(
+                target_pr, trim_diff_content(diff_content)
+            )
             logger.info(f"📊 完整查询大小: {len(analysis_prompt):,} 字符")
 
             # 构建系统提示（使用公共函数）
@@ -707,9 +700,19 @@ class PRAnalysisLangChain:
             logger.info("\n=== Claude 分析结果 ===")
 
             # 创建 Agent 提示模板
+            # 系统提示设置缓存断点：缓存前缀包含工具定义和系统提示，
+            # Agent 每一轮迭代都能复用，不必重复计费
             prompt = ChatPromptTemplate.from_messages(
                 [
-                    ("system", system_prompt),
+                    SystemMessage(
+                        content=[
+                            {
+                                "type": "text",
+                                "text": system_prompt,
+                                "cache_control": {"type": "ephemeral"},
+                            }
+                        ]
+                    ),
                     ("human", "{input}"),
                     MessagesPlaceholder(variable_name="agent_scratchpad"),
                 ]
@@ -57,7 +57,9 @@ class PRScraperScheduler:
         try:
             while True:
                 schedule.run_pending()
-                time.sleep(60)  # Check every minute
+                # Sleep until the next job is due instead of polling every minute
+                idle_seconds = schedule.idle_seconds()
+                time.sleep(max(1, idle_seconds if idle_seconds is not None else 60))
         except KeyboardInterrupt:
             self.logger.info("Scheduler stopped by user")
         except Exception as e:
@@ -1,6 +1,14 @@
-import json
+import asyncio
+import operator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import aiohttp
+import orjson
+
 from database import DatabaseManager
 from github_client import GitHubClient
+from pr_analysis_common import invalidate_pr_cache
 from config import GITHUB_TOKEN
 from logger_config import setup_logger
 
@@ -15,32 +23,45 @@ python scraper.py --number 12345
 python scraper.py --since_date 2024-01-01 --days 7
 """
 
+# Maximum number of diff downloads in flight
+MAX_CONCURRENT_DOWNLOADS = 16
+# aiohttp connection pool size
+HTTP_CONNECTION_LIMIT = 32
+# PRs listed but not yet picked up by a download consumer (one GraphQL page)
+PR_QUEUE_SIZE = 100
+# Number of PRs stored per database transaction
+INSERT_BATCH_SIZE = 100
+# Flush pending PRs early once their diffs exceed this many characters,
+# so a run of large PRs does not pile up in memory
+INSERT_BATCH_MAX_CHARS = 32 * 1024 * 1024
+
+_label_name = operator.itemgetter("name")
+
 
 class PRScraper:
     def __init__(self, github_token):
         self.db = DatabaseManager()
         self.github = GitHubClient(github_token)
+        # The MySQL connection is not thread-safe: run DB work on one thread
+        self.db_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="scraper-db"
+        )
 
-    def process_pr(self, pr):
+    @staticmethod
+    def _extract_pr_data(pr):
         """
-        Process a single pull request
+        Extract the database row for a pull request
         """
-        logger.info(f"Processing PR #{pr['number']}: {pr['title']}")
-
-        # Check if PR already exists in database
-        if self.db.pr_exists(pr["number"]):
-            logger.info(f"PR #{pr['number']} already exists, skipping...")
-            return True
-
-        # Extract PR data
-        pr_data = {
+        return {
             "number": pr["number"],
             "title": pr["title"],
             "body": pr.get("body", ""),
             "created_at": pr["created_at"],
             "merged_at": pr["merged_at"],
             "user": pr["user"]["login"],
-            "labels": json.dumps([label["name"] for label in pr.get("labels", [])]),
+            "labels": orjson.dumps(
+                list(map(_label_name, pr.get("labels") or ()))
+            ).decode("utf-8"),
             "head": pr["head"]["ref"],
             "base": pr["base"]["ref"],
             "diff_url": pr["diff_url"],
@@ -50,6 +71,17 @@ class PRScraper:
             "merge_commit": pr.get("merge_commit", ""),
         }
 
+    def process_pr(self, pr):
+        """
+        Process a single pull request
+        """
+        logger.info(f"Processing PR #{pr['number']}: {pr['title']}")
+
+        # Check if PR already exists in database
+        if self.db.pr_exists(pr["number"]):
+            logger.info(f"PR #{pr['number']} already exists, skipping...")
+            return True
+
         # Get diff content
         diff_content, error = self.github.get_diff_content(pr["diff_url"])
         if error:
@@ -58,6 +90,166 @@ class PRScraper:
             )
             return False
 
+        return self._save_pr(pr, diff_content)
+
+    async def fetch_pr_async(self, pr, session, semaphore):
+        """
+        Download the diff of a single pull request asynchronously
+
+        Returns:
+            (pr_data, diff_content, comments_data) record to store, or None
+            when the diff could not be fetched
+        """
+        logger.info(f"Processing PR #{pr['number']}: {pr['title']}")
+
+        # Get diff content
+        async with semaphore:
+            diff_content, error = await self.github.get_diff_content_async(
+                session, pr["diff_url"]
+            )
+        if error:
+            logger.error(
+                f"Failed to fetch diff content for PR #{pr['number']}: {error}"
+            )
+            return None
+
+        # Comments data is already in the PR object (fetched via GraphQL)
+        return self._extract_pr_data(pr), diff_content, pr.get("comments", [])
+
+    async def _scrape_date_range_async(self, since_date_str, days):
+        """
+        Page through merged PRs and download their diffs in a pipeline:
+        the GraphQL listing feeds a queue while MAX_CONCURRENT_DOWNLOADS
+        consumers download diffs, so downloads start with the first page
+
+        Returns:
+            Number of merged PRs found
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=PR_QUEUE_SIZE)
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        connector = aiohttp.TCPConnector(limit=HTTP_CONNECTION_LIMIT)
+        records = []
+        pending_chars = 0
+
+        async def flush():
+            nonlocal records, pending_chars
+            if not records:
+                return
+            batch, records, pending_chars = records, [], 0
+            await loop.run_in_executor(self.db_executor, self._save_records, batch)
+
+        found = 0
+
+        async def produce(session):
+            nonlocal found
+            # Search results can shift while paginating, so the same PR may show
+            # up on two pages; only queue each PR once per run
+            seen = set()
+            async for page in self.github.iter_iotdb_prs_async(
+                session, since_date=since_date_str, days=days
+            ):
+                page = [pr for pr in page if pr["number"] not in seen]
+                seen.update(pr["number"] for pr in page)
+                found += len(page)
+                # Check which PRs already exist in one query per page
+                existing = await loop.run_in_executor(
+                    self.db_executor,
+                    self.db.existing_pr_numbers,
+                    [pr["number"] for pr in page],
+                )
+                for pr in page:
+                    if pr["number"] in existing:
+                        logger.info(f"PR #{pr['number']} already exists, skipping...")
+                        continue
+                    await queue.put(pr)
+
+            for _ in range(MAX_CONCURRENT_DOWNLOADS):
+                await queue.put(None)
+
+        async def consume(session):
+            nonlocal pending_chars
+            while True:
+                pr = await queue.get()
+                if pr is None:
+                    return
+                try:
+                    record = await self.fetch_pr_async(pr, session, semaphore)
+                except Exception as e:
+                    logger.error(f"Failed to fetch PR #{pr['number']}: {e}")
+                    continue
+                if record is None:
+                    continue
+                records.append(record)
+                pending_chars += len(record[1] or "")
+                if (
+                    len(records) >= INSERT_BATCH_SIZE
+                    or pending_chars >= INSERT_BATCH_MAX_CHARS
+                ):
+                    await flush()
+
+        async with aiohttp.ClientSession(
+            connector=connector, headers=self.github.headers
+        ) as session:
+            tasks = [asyncio.create_task(produce(session))] + [
+                asyncio.create_task(consume(session))
+                for _ in range(MAX_CONCURRENT_DOWNLOADS)
+            ]
+            try:
+                # Stop as soon as any task fails: otherwise the producer could
+                # block forever on a full queue, or consumers wait forever for
+                # sentinels a failed producer never sends
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                # Store what was downloaded before a failure as well
+                await flush()
+
+        return found
+
+    def _save_records(self, records):
+        """
+        Store a batch of PR records in one transaction, falling back to
+        one transaction per PR if the batch fails
+        """
+        if not records:
+            return
+
+        try:
+            if self.db.insert_prs_bulk(records):
+                for pr_data, _, _ in records:
+                    logger.info(
+                        f"Successfully processed PR #{pr_data['number']} with all data"
+                    )
+                return
+
+            logger.warning(
+                f"Batch insert of {len(records)} PRs failed, retrying one by one"
+            )
+            for pr_data, diff_content, comments_data in records:
+                if self.db.insert_pr_diff_comments(
+                    pr_data, diff_content, comments_data
+                ):
+                    logger.info(
+                        f"Successfully processed PR #{pr_data['number']} with all data"
+                    )
+                else:
+                    logger.error(f"Failed to process PR #{pr_data['number']}")
+        finally:
+            # Drop stale copies of these PRs from the in-process analysis cache
+            invalidate_pr_cache(pr_data["number"] for pr_data, _, _ in records)
+
+    def _save_pr(self, pr, diff_content):
+        """
+        Store PR, diff and comments
+        """
+        pr_data = self._extract_pr_data(pr)
+
         # Get comments data from PR object (already fetched via GraphQL)
         comments_data = pr.get("comments", [])
 
@@ -144,6 +336,7 @@ class PRScraper:
         except Exception as e:
             logger.error(f"Error during scraping: {e}")
         finally:
+            self.github.close()
             self.db.close()
 
     def run_by_date_range(self, since_date_str, days):
@@ -154,27 +347,24 @@ class PRScraper:
             logger.info(
                 f"Starting PR scraper from {since_date_str} at {datetime.now()}"
             )
-            prs = self.github.get_iotdb_prs(since_date=since_date_str, days=days)
+            found = asyncio.run(self._scrape_date_range_async(since_date_str, days))
 
-            if not prs:
+            if not found:
                 logger.info("No merged PRs found")
                 return
 
-            logger.info(f"Found {len(prs)} merged PRs")
-
-            for pr in prs:
-                self.process_pr(pr)
-
+            logger.info(f"Found {found} merged PRs")
             logger.info(f"Scraping completed at {datetime.now()}")
         except Exception as e:
             logger.error(f"Error during scraping: {e}")
         finally:
+            self.db_executor.shutdown()
+            self.github.close()
             self.db.close()
 
 
 if __name__ == "__main__":
     import argparse
-    from datetime import datetime
 
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="GitHub PR Scraper")
@@ -5,6 +5,7 @@ PR分析搜索工具
 """
 
 import argparse
+import shlex
 import sys
 from typing import List, Dict
 from vector_store import VectorStoreManager
@@ -12,76 +13,76 @@ from logger_config import setup_logger
 
 logger = setup_logger(__name__)
 
+# 进程内共享的向量数据库，避免每条命令重复加载 embedding 模型
+_vector_store = None
+
+
+SEP = "=" * 80
+_CONTENT_HEADER = f"{'内容片段':^80}"
+_CONTENT_RULE = "-" * 80
+# 非完整模式下显示的内容字符数
+PREVIEW_CHARS = 500
 
-def format_search_result(result: Dict, index: int, show_full: bool = False) -> str:
-    """格式化搜索结果"""
-    output = []
-    output.append(f"\n{'='*80}")
-    output.append(f"结果 #{index}")
-    output.append(f"{'='*80}")
-    output.append(f"PR编号: #{result['pr_number']}")
-    output.append(f"PR标题: {result['pr_title']}")
 
+def _format_result(
+    heading: str,
+    pr_number,
+    pr_title,
+    metadata: Dict,
+    content: str,
+    show_full: bool,
+) -> str:
+    """按统一模板拼接一条搜索结果"""
     # 显示元数据
-    metadata = result.get("metadata", {})
+    meta = ""
     if metadata.get("analyzed_at"):
-        output.append(f"分析时间: {metadata['analyzed_at']}")
+        meta += f"\n分析时间: {metadata['analyzed_at']}"
     if metadata.get("chunk_index") is not None:
-        output.append(
-            f"文档块: {metadata['chunk_index'] + 1}/{metadata.get('total_chunks', '?')}"
-        )
+        meta += f"\n文档块: {metadata['chunk_index'] + 1}/{metadata.get('total_chunks', '?')}"
 
-    output.append(f"\n{'内容片段':^80}")
-    output.append("-" * 80)
+    # 显示内容，非完整模式只显示前 PREVIEW_CHARS 个字符
+    if not show_full and len(content) > PREVIEW_CHARS:
+        content = f"{content[:PREVIEW_CHARS]}\n...(更多内容)"
 
-    # 显示内容
-    content = result["content"]
-    if show_full:
-        output.append(content)
-    else:
-        # 只显示前500个字符
-        preview = content[:500]
-        if len(content) > 500:
-            preview += "\n...(更多内容)"
-        output.append(preview)
+    return (
+        f"\n{SEP}\n{heading}\n{SEP}\n"
+        f"PR编号: #{pr_number}\nPR标题: {pr_title}{meta}\n"
+        f"\n{_CONTENT_HEADER}\n{_CONTENT_RULE}\n{content}"
+    )
 
-    return "\n".join(output)
+
+def format_search_result(result: Dict, index: int, show_full: bool = False) -> str:
+    """格式化搜索结果"""
+    return _format_result(
+        f"结果 #{index}",
+        result["pr_number"],
+        result["pr_title"],
+        result.get("metadata", {}),
+        result["content"],
+        show_full,
+    )
 
 
 def format_search_result_with_score(
     doc, score: float, index: int, show_full: bool = False
 ) -> str:
     """格式化带分数的搜索结果"""
-    output = []
-    output.append(f"\n{'='*80}")
-    output.append(f"结果 #{index} - 相似度: {score:.4f}")
-    output.append(f"{'='*80}")
-    output.append(f"PR编号: #{doc.metadata.get('pr_number')}")
-    output.append(f"PR标题: {doc.metadata.get('pr_title')}")
+    return _format_result(
+        f"结果 #{index} - 相似度: {score:.4f}",
+        doc.metadata.get("pr_number"),
+        doc.metadata.get("pr_title"),
+        doc.metadata,
+        doc.page_content,
+        show_full,
+    )
 
-    # 显示元数据
-    if doc.metadata.get("analyzed_at"):
-        output.append(f"分析时间: {doc.metadata['analyzed_at']}")
-    if doc.metadata.get("chunk_index") is not None:
-        output.append(
-            f"文档块: {doc.metadata['chunk_index'] + 1}/{doc.metadata.get('total_chunks', '?')}"
-        )
-
-    output.append(f"\n{'内容片段':^80}")
-    output.append("-" * 80)
-
-    # 显示内容
-    content = doc.page_content
-    if show_full:
-        output.append(content)
-    else:
-        # 只显示前500个字符
-        preview = content[:500]
-        if len(content) > 500:
-            preview += "\n...(更多内容)"
-        output.append(preview)
 
-    return "\n".join(output)
+def get_vector_store() -> VectorStoreManager:
+    """获取进程内共享的向量数据库（首次调用时初始化）"""
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = VectorStoreManager()
+    return _vector_store
 
 
 def search_command(args):
@@ -89,8 +90,8 @@ def search_command(args):
     logger.info(f"\n🔍 搜索查询: {args.query}")
     logger.info(f"📊 返回结果数: {args.top_k}")
 
-    # 初始化向量数据库
-    vector_store = VectorStoreManager()
+    # 获取向量数据库
+    vector_store = get_vector_store()
 
     # 获取统计信息
     stats = vector_store.get_collection_stats()
@@ -124,8 +125,8 @@ def fetch_command(args):
     pr_number = args.pr_number
     logger.info(f"\n🔍 获取PR #{pr_number}的分析结果...")
 
-    # 初始化向量数据库
-    vector_store = VectorStoreManager()
+    # 获取向量数据库
+    vector_store = get_vector_store()
 
     # 获取特定PR
     result = vector_store.get_pr_by_number(pr_number)
@@ -155,7 +156,7 @@ def stats_command(args):
     logger.info("\n📊 向量数据库统计信息")
     logger.info("=" * 80)
 
-    vector_store = VectorStoreManager()
+    vector_store = get_vector_store()
     stats = vector_store.get_collection_stats()
 
     logger.info(f"集合名称: {stats.get('collection_name', 'N/A')}")
@@ -164,8 +165,58 @@ def stats_command(args):
     logger.info("=" * 80)
 
 
-def main():
-    """主函数"""
+def repl_command(args, parser):
+    """交互模式：在同一进程中连续执行命令，embedding 模型只加载一次"""
+    logger.info("进入交互模式，输入 search/fetch/stats 命令，输入 exit 退出")
+    get_vector_store()
+
+    while True:
+        try:
+            line = input("search_pr> ").strip()
+        except EOFError:
+            break
+
+        if not line:
+            continue
+        if line in ("exit", "quit"):
+            break
+
+        try:
+            line_args = parser.parse_args(shlex.split(line))
+        except SystemExit:
+            # argparse 在参数错误或 --help 时会退出，交互模式下继续读取
+            continue
+        except ValueError as e:
+            logger.error(f"❌ 无法解析命令: {e}")
+            continue
+
+        if line_args.command == "repl":
+            continue
+        try:
+            run_command(line_args, parser)
+        except Exception as e:
+            logger.error(f"\n❌ 错误: {e}")
+
+
+def run_command(args, parser) -> int:
+    """执行一条命令"""
+    if args.command == "search":
+        search_command(args)
+    elif args.command == "fetch":
+        fetch_command(args)
+    elif args.command == "stats":
+        stats_command(args)
+    elif args.command == "repl":
+        repl_command(args, parser)
+    else:
+        parser.print_help()
+        return 1
+
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
     parser = argparse.ArgumentParser(
         description="PR分析搜索工具 - 使用向量数据库进行语义搜索",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -188,6 +239,9 @@ def main():
 
   # 查看数据库统计
   python search_pr_analysis.py stats
+
+  # 交互模式，连续执行多条命令
+  python search_pr_analysis.py repl
         """,
     )
 
@@ -211,21 +265,20 @@ def main():
     # 统计命令
     subparsers.add_parser("stats", help="显示数据库统计信息")
 
+    # 交互命令
+    subparsers.add_parser("repl", help="交互模式，连续执行多条命令")
+
+    return parser
+
+
+def main():
+    """主函数"""
+    parser = build_parser()
     args = parser.parse_args()
 
     # 执行命令
     try:
-        if args.command == "search":
-            search_command(args)
-        elif args.command == "fetch":
-            fetch_command(args)
-        elif args.command == "stats":
-            stats_command(args)
-        else:
-            parser.print_help()
-            return 1
-
-        return 0
+        return run_command(args, parser)
 
     except KeyboardInterrupt:
         logger.info("\n⏹️ 用户中断操作")
@@ -10,7 +10,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import asyncio
-import json
+import orjson
 from pr_analysis_langchain import PRAnalysisLangChain
 from vector_store import VectorStoreManager
 
@@ -39,8 +39,8 @@ async def demo_workflow():
 
     if os.path.exists(analysis_file):
         print(f"✅ 发现已有分析结果: {analysis_file}")
-        with open(analysis_file, "r", encoding="utf-8") as f:
-            result = json.load(f)
+        with open(analysis_file, "rb") as f:
+            result = orjson.loads(f.read())
         print(f"PR #{result['pr_number']}: {result['pr_title']}")
         print(f"分析时间: {result['analyzed_at']}")
 
@@ -61,8 +61,8 @@ async def demo_workflow():
             print(f"PR #{result['pr_number']}: {result['pr_title']}")
 
             # 保存到文件
-            with open(analysis_file, "w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
+            with open(analysis_file, "wb") as f:
+                f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
             print(f"✅ 结果已保存到: {analysis_file}")
         else:
             print(f"❌ 分析失败: {result['error']}")
@@ -88,12 +88,13 @@ async def demo_workflow():
         "feature.xml文件路径",
     ]
 
-    for query in search_queries:
+    # 所有查询一次向量化、一次查询向量数据库
+    batch_results = vector_store.search_with_score_batch(search_queries, k=2)
+
+    for query, results in zip(search_queries, batch_results):
         print(f"\n🔍 搜索: '{query}'")
         print("  " + "-" * 76)
 
-        results = vector_store.search_with_score(query, k=2)
-
         if results:
             for idx, (doc, score) in enumerate(results, 1):
                 pr_num = doc.metadata.get("pr_number")
@@ -2,38 +2,157 @@
 """
 Git 工具功能测试
 测试 LangChain 中新增的 git 工具（支持管道）
+
+各用例互相独立，可以并行运行: pytest -n auto test/test_git_tool.py
 """
+
 import sys
 from pathlib import Path
 
+import pytest
+
 # 添加父目录到Python路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 
 from pr_analysis_langchain import PRAnalysisLangChain
 
-
-def test_git_tool():
-    """测试 git 工具的各种功能"""
-
-    print("=" * 80)
-    print("🧪 Git 工具功能测试")
-    print("=" * 80)
-
-    # 初始化分析器
+# 测试用例
+TEST_CASES = [
+    {
+        "name": "基本命令：git status",
+        "command": "git status",
+        "should_succeed": True,
+        "tool": "git",
+    },
+    {
+        "name": "基本命令：git log",
+        "command": "git log --oneline -5",
+        "should_succeed": True,
+        "tool": "git",
+    },
+    {
+        # git 工具禁止管道、重定向和命令链接，以下用例都应被拒绝
+        "name": "管道拦截：git log | grep（匹配 Fix）",
+        "command": "git log --oneline -10 | grep -i 'fix'",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "管道拦截：git log | head",
+        "command": "git log --oneline | head -3",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "管道拦截：git branch | grep",
+        "command": "git branch -a | grep 'HEAD'",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "重定向拦截：git log 输出到文件",
+        "command": "git log --oneline -5 > /tmp/git_test_output.txt && cat /tmp/git_test_output.txt",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "重定向拦截：git status 追加到文件",
+        "command": "git status >> /tmp/git_test_output.txt && tail -3 /tmp/git_test_output.txt",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "命令链接拦截：git branch && git status",
+        "command": "git branch && git status",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "复杂组合拦截：log | grep | head",
+        "command": "git log --oneline -20 | grep -i 'cache' | head -3",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "危险命令拦截：git push",
+        "command": "git push origin main",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "危险命令拦截：git reset",
+        "command": "git reset --hard HEAD",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "安全检查：命令注入",
+        "command": "git status; rm -rf /tmp/test",
+        "should_succeed": False,
+        "tool": "git",
+    },
+    {
+        "name": "Bash工具（不支持管道）：git log | grep",
+        "command": "git log --oneline -10 | grep '添加'",
+        "should_succeed": False,  # bash 工具不支持管道
+        "tool": "bash",
+    },
+]
+
+
+def _get_tools():
+    """初始化分析器并返回 (git_tool, bash_tool)"""
     analyzer = PRAnalysisLangChain()
 
-    # 获取 git 工具
-    tools = analyzer._create_tools()
     git_tool = None
     bash_tool = None
-
-    for tool in tools:
+    for tool in analyzer._create_tools():
         if tool.name == "git":
             git_tool = tool
         elif tool.name == "bash":
             bash_tool = tool
 
+    return git_tool, bash_tool
+
+
+def _run_case(test, git_tool, bash_tool):
+    """执行单个用例，返回 (是否符合预期, 输出)"""
+    tool = git_tool if test["tool"] == "git" else bash_tool
+    result = tool.func(command=test["command"])
+
+    # 判断是否成功
+    is_success = not result.startswith("错误")
+    return is_success == test["should_succeed"], result
+
+
+@pytest.fixture(scope="module")
+def tools():
+    git_tool, bash_tool = _get_tools()
+    assert git_tool is not None, "未找到 git 工具"
+    return git_tool, bash_tool
+
+
+@pytest.mark.parametrize("test", TEST_CASES, ids=[case["name"] for case in TEST_CASES])
+def test_git_tool_case(test, tools):
+    git_tool, bash_tool = tools
+    if test["tool"] == "bash" and not bash_tool:
+        pytest.skip("工具不存在")
+
+    passed, result = _run_case(test, git_tool, bash_tool)
+    assert passed, f"预期: {'成功' if test['should_succeed'] else '失败'}\n{result}"
+
+
+def run_git_tool_tests():
+    """测试 git 工具的各种功能"""
+
+    print("=" * 80)
+    print("🧪 Git 工具功能测试")
+    print("=" * 80)
+
+    # 获取 git 工具
+    git_tool, bash_tool = _get_tools()
+
     if not git_tool:
         print("❌ 未找到 git 工具")
         return False
@@ -42,93 +161,11 @@ def test_git_tool():
     print(f"✅ 找到 bash 工具: {bash_tool.name if bash_tool else 'None'}")
     print()
 
-    # 测试用例
-    test_cases = [
-        {
-            "name": "基本命令：git status",
-            "command": "git status",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "基本命令：git log",
-            "command": "git log --oneline -5",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "管道命令：git log | grep（匹配 Fix）",
-            "command": "git log --oneline -10 | grep -i 'fix'",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "管道命令：git log | head",
-            "command": "git log --oneline | head -3",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "管道命令：git branch | grep",
-            "command": "git branch -a | grep 'HEAD'",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "重定向：git log 输出到文件",
-            "command": "git log --oneline -5 > /tmp/git_test_output.txt && cat /tmp/git_test_output.txt",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "重定向：git status 追加到文件",
-            "command": "git status >> /tmp/git_test_output.txt && tail -3 /tmp/git_test_output.txt",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "命令链接：git branch && git status",
-            "command": "git branch && git status",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "复杂组合：checkout && log | grep",
-            "command": "git log --oneline -20 | grep -i 'cache' | head -3",
-            "should_succeed": True,
-            "tool": "git",
-        },
-        {
-            "name": "危险命令拦截：git push",
-            "command": "git push origin main",
-            "should_succeed": False,
-            "tool": "git",
-        },
-        {
-            "name": "危险命令拦截：git reset",
-            "command": "git reset --hard HEAD",
-            "should_succeed": False,
-            "tool": "git",
-        },
-        {
-            "name": "安全检查：命令注入",
-            "command": "git status; rm -rf /tmp/test",
-            "should_succeed": False,
-            "tool": "git",
-        },
-        {
-            "name": "Bash工具（不支持管道）：git log | grep",
-            "command": "git log --oneline -10 | grep '添加'",
-            "should_succeed": False,  # bash 工具不支持管道
-            "tool": "bash",
-        },
-    ]
-
     results = []
 
-    for i, test in enumerate(test_cases, 1):
+    for i, test in enumerate(TEST_CASES, 1):
         print(f"\n{'='*80}")
-        print(f"测试 {i}/{len(test_cases)}: {test['name']}")
+        print(f"测试 {i}/{len(TEST_CASES)}: {test['name']}")
         print(f"{'='*80}")
         print(f"命令: {test['command']}")
         print(f"使用工具: {test['tool']}")
@@ -143,19 +180,16 @@ def test_git_tool():
 
         # 执行命令
         try:
-            result = tool.func(command=test["command"])
-
-            # 判断是否成功
-            is_success = not result.startswith("错误")
+            passed, result = _run_case(test, git_tool, bash_tool)
 
             # 检查结果是否符合预期
-            if is_success == test["should_succeed"]:
+            if passed:
                 print(f"\n✅ 测试通过")
                 results.append(True)
             else:
                 print(f"\n❌ 测试失败")
                 print(f"   预期: {'成功' if test['should_succeed'] else '失败'}")
-                print(f"   实际: {'成功' if is_success else '失败'}")
+                print(f"   实际: {'失败' if test['should_succeed'] else '成功'}")
                 results.append(False)
 
             # 显示输出摘要
@@ -193,7 +227,7 @@ def test_git_tool():
 def main():
     """主函数"""
     try:
-        success = test_git_tool()
+        success = run_git_tool_tests()
         return 0 if success else 1
     except KeyboardInterrupt:
         print("\n\n⏹️ 测试被中断")
@@ -4,49 +4,267 @@
 支持向量化存储、语义检索和相似度搜索
 """
 
+import hashlib
 import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
 
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
 from logger_config import setup_logger
 
+try:
+    import numpy as np
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
 logger = setup_logger(__name__)
 
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+# int8 量化的 ONNX 模型目录，存在且安装了 optimum[onnxruntime] 时优先使用
+ONNX_MODEL_NAME = f"{MODEL_NAME}-onnx-int8"
+ONNX_BATCH_SIZE = 32
+# 与 sentence-transformers 配置中的 max_seq_length 保持一致
+ONNX_MAX_SEQ_LENGTH = 128
+# 查询向量的内存 LRU 缓存大小
+QUERY_CACHE_MAXSIZE = 1024
+# HuggingFace 模型的权重精度；CPU 支持 bf16（AVX512-BF16/AMX）时可设为 "bfloat16"，
+# 权重占用的内存和带宽减半，但向量与 float32 有细微差异
+HF_TORCH_DTYPE = "float32"
+HF_BATCH_SIZE = 64
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    基于 ONNX Runtime 的 int8 量化 MiniLM embedding
+
+    与 HuggingFaceEmbeddings 的输出一致：mean pooling 后做 L2 归一化。
+    模型目录通过 optimum 导出并动态量化得到:
+        optimum-cli export onnx --model models/paraphrase-multilingual-MiniLM-L12-v2 \\
+            --task feature-extraction /tmp/minilm-onnx
+        optimum-cli onnxruntime quantize --onnx_model /tmp/minilm-onnx --avx512_vnni \\
+            -o models/paraphrase-multilingual-MiniLM-L12-v2-onnx-int8
+    并将原模型目录中的 tokenizer 文件复制到量化后的目录。
+    """
+
+    def __init__(self, model_path: str, batch_size: int = ONNX_BATCH_SIZE):
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = os.cpu_count() or 1
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_path,
+            file_name="model_quantized.onnx",
+            provider="CPUExecutionProvider",
+            session_options=session_options,
+        )
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[start : start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=ONNX_MAX_SEQ_LENGTH,
+                return_tensors="np",
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            # mean pooling（忽略 padding）后 L2 归一化
+            mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(
+                np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None
+            )
+            embeddings.extend(pooled.tolist())
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    按内容哈希缓存 embedding 结果，相同文本不再重复计算
+
+    文档向量持久化到 SQLite（键为 BLAKE2b(模型名 + 文本)），
+    查询向量另外保存在进程内的 LRU 缓存中。
+    embedding 模型在第一次缓存未命中时才加载
+    """
+
+    def __init__(
+        self,
+        load_embeddings: Callable[[], Embeddings],
+        cache_path: str,
+        namespace: str,
+    ):
+        """
+        Args:
+            load_embeddings: 创建实际计算向量的 embedding 模型的函数
+            cache_path: SQLite 缓存文件路径
+            namespace: 模型标识，不同模型的向量互不复用
+        """
+        self._load_embeddings = load_embeddings
+        self._embeddings = None
+        self.namespace = namespace.encode("utf-8")
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        # 缓存丢失只需重新计算向量：WAL + synchronous=NORMAL，每次提交不再 fsync
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._conn.commit()
+        self._query_cache = OrderedDict()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """实际的 embedding 模型（首次访问时加载）"""
+        if self._embeddings is None:
+            with self._load_lock:
+                if self._embeddings is None:
+                    logger.info("正在加载embedding模型...")
+                    self._embeddings = self._load_embeddings()
+        return self._embeddings
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.blake2b(self.namespace, digest_size=16)
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+
+        rows = []
+        with self._lock:
+            # 分组查询，避免超过 SQLite 的参数个数上限
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start : start + 500]
+                placeholders = ", ".join(["?"] * len(batch))
+                rows.extend(
+                    self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        batch,
+                    )
+                )
+        cached = {key: array("d", vector).tolist() for key, vector in rows}
+
+        # 只对未命中的文本调用模型，同一批中的重复文本只计算一次
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_rows = []
+            for key, vector in zip(missing, vectors):
+                cached[key] = list(vector)
+                new_rows.append((key, array("d", vector).tobytes()))
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    new_rows,
+                )
+                self._conn.commit()
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                return vector
+
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._query_cache[text] = vector
+            if len(self._query_cache) > QUERY_CACHE_MAXSIZE:
+                self._query_cache.popitem(last=False)
+        return vector
+
 
 class VectorStoreManager:
     """管理PR分析结果的向量数据库"""
 
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(
+        self,
+        persist_directory: str = "./chroma_db",
+        embedding_cache_path: Optional[str] = None,
+    ):
         """
         初始化向量数据库管理器
 
         Args:
             persist_directory: Chroma数据库持久化目录
+            embedding_cache_path: embedding 缓存文件路径，默认位于 persist_directory 下
         """
         self.persist_directory = persist_directory
 
         # 确保目录存在
         os.makedirs(persist_directory, exist_ok=True)
 
-        # 初始化embedding模型 - 使用轻量级的中文模型
-        logger.info("正在加载embedding模型...")
+        # 选择embedding模型 - 使用轻量级的中文模型
+        # 模型在第一次需要计算向量时才加载，只查询统计、删除等操作无需加载
         # 获取项目根目录（vector_store.py所在目录）
         project_root = Path(__file__).parent
-        model_path = project_root / "models" / "paraphrase-multilingual-MiniLM-L12-v2"
+        model_path = project_root / "models" / MODEL_NAME
+        onnx_model_path = project_root / "models" / ONNX_MODEL_NAME
+
+        if ONNX_AVAILABLE and onnx_model_path.exists():
+            logger.info(f"使用 ONNX int8 模型: {onnx_model_path}")
+            model_name = ONNX_MODEL_NAME
 
-        if not model_path.exists():
-            raise FileNotFoundError(
-                f"模型文件不存在: {model_path}\n" f"请确保模型已下载到正确位置"
+            def load_embeddings():
+                return OnnxEmbeddings(str(onnx_model_path))
+
+        else:
+            if not model_path.exists():
+                raise FileNotFoundError(
+                    f"模型文件不存在: {model_path}\n" f"请确保模型已下载到正确位置"
+                )
+            # 不同精度算出的向量不同，缓存互不复用
+            model_name = (
+                MODEL_NAME
+                if HF_TORCH_DTYPE == "float32"
+                else f"{MODEL_NAME}-{HF_TORCH_DTYPE}"
             )
 
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=str(model_path),
-            model_kwargs={"device": "cpu"},
-            encode_kwargs={"normalize_embeddings": True},
+            def load_embeddings():
+                return HuggingFaceEmbeddings(
+                    model_name=str(model_path),
+                    model_kwargs={
+                        "device": "cpu",
+                        "model_kwargs": {"torch_dtype": HF_TORCH_DTYPE},
+                    },
+                    encode_kwargs={
+                        "normalize_embeddings": True,
+                        "batch_size": HF_BATCH_SIZE,
+                    },
+                )
+
+        # 相同内容（重新分析、重试）不再重复计算向量
+        self.embeddings = CachedEmbeddings(
+            load_embeddings,
+            embedding_cache_path
+            or os.path.join(persist_directory, "embedding_cache.sqlite3"),
+            model_name,
         )
 
         # 初始化或加载Chroma向量数据库
@@ -68,14 +286,57 @@ class VectorStoreManager:
         Returns:
             如果PR已存在返回True，否则返回False
         """
+        return pr_number in self.existing_pr_numbers([pr_number])
+
+    def existing_pr_numbers(self, pr_numbers: List[int]) -> set:
+        """
+        一次查询批量检查哪些PR已存在于向量数据库中
+
+        Args:
+            pr_numbers: PR编号列表
+
+        Returns:
+            已存在的PR编号集合
+        """
+        pr_numbers = list(pr_numbers)
+        if not pr_numbers:
+            return set()
+
         try:
-            # 查询指定pr_number的文档
-            results = self.vectorstore.get(where={"pr_number": pr_number})
-            # 如果有结果，说明PR已存在
-            return len(results.get("ids", [])) > 0
+            results = self.vectorstore.get(
+                where={"pr_number": {"$in": pr_numbers}}, include=["metadatas"]
+            )
         except Exception as e:
-            logger.warning(f"检查PR是否存在时出错: {e}")
-            return False
+            logger.warning(f"批量检查PR是否存在时出错: {e}")
+            return set()
+
+        return {
+            metadata["pr_number"]
+            for metadata in results.get("metadatas") or []
+            if metadata and "pr_number" in metadata
+        }
+
+    @staticmethod
+    def _build_document(
+        pr_number: int, pr_title: str, analysis: str, metadata: Optional[Dict]
+    ) -> Document:
+        """构建PR分析结果对应的Document"""
+        # 准备文档元数据
+        doc_metadata = {
+            "pr_number": pr_number,
+            "pr_title": pr_title,
+            "analyzed_at": datetime.now().isoformat(),
+            "source": "claude_analysis",
+        }
+
+        # 合并用户提供的额外元数据
+        if metadata:
+            doc_metadata.update(metadata)
+
+        # 创建完整的文档内容，包含PR基本信息
+        content = f"PR #{pr_number}: {pr_title}\n\n{analysis}"
+
+        return Document(page_content=content, metadata=doc_metadata)
 
     def add_pr_analysis(
         self,
@@ -104,23 +365,7 @@ class VectorStoreManager:
                 logger.info(f"PR #{pr_number} 已存在于向量数据库中，跳过添加")
                 return False
 
-            # 准备文档元数据
-            doc_metadata = {
-                "pr_number": pr_number,
-                "pr_title": pr_title,
-                "analyzed_at": datetime.now().isoformat(),
-                "source": "claude_analysis",
-            }
-
-            # 合并用户提供的额外元数据
-            if metadata:
-                doc_metadata.update(metadata)
-
-            # 创建完整的文档内容，包含PR基本信息
-            content = f"PR #{pr_number}: {pr_title}\n\n{analysis}"
-
-            # 创建单个Document对象
-            doc = Document(page_content=content, metadata=doc_metadata)
+            doc = self._build_document(pr_number, pr_title, analysis, metadata)
 
             # 添加到向量数据库
             self.vectorstore.add_documents([doc])
@@ -132,6 +377,58 @@ class VectorStoreManager:
             logger.error(f"添加PR分析到向量数据库失败: {e}")
             return False
 
+    def add_pr_analyses_bulk(
+        self, items: List[tuple], skip_if_exists: bool = True
+    ) -> int:
+        """
+        批量添加PR分析结果，所有文档在一次 add_documents 中批量向量化
+
+        Args:
+            items: (pr_number, pr_title, analysis, metadata) 元组列表
+            skip_if_exists: 是否跳过已存在的PR（一次查询批量检查）
+
+        Returns:
+            成功添加的PR数量
+        """
+        if not items:
+            return 0
+
+        try:
+            existing = set()
+            if skip_if_exists:
+                existing = self.existing_pr_numbers([item[0] for item in items])
+
+            docs = []
+            for pr_number, pr_title, analysis, metadata in items:
+                if pr_number in existing:
+                    logger.info(f"PR #{pr_number} 已存在于向量数据库中，跳过添加")
+                    continue
+                # 同一批中重复的PR只添加一次
+                existing.add(pr_number)
+                docs.append(
+                    self._build_document(pr_number, pr_title, analysis, metadata)
+                )
+
+            if docs:
+                self.vectorstore.add_documents(docs)
+                logger.info(f"{len(docs)} 个PR分析结果已批量添加到向量数据库")
+
+            return len(docs)
+
+        except Exception as e:
+            logger.error(f"批量添加PR分析到向量数据库失败: {e}")
+            return 0
+
+    @staticmethod
+    def _format_search_result(doc: Document) -> Dict:
+        """将搜索命中的Document格式化为结果字典"""
+        return {
+            "pr_number": doc.metadata.get("pr_number"),
+            "pr_title": doc.metadata.get("pr_title"),
+            "content": doc.page_content,
+            "metadata": doc.metadata,
+        }
+
     def search_similar_prs(
         self, query: str, k: int = 5, filter_dict: Optional[Dict] = None
     ) -> List[Dict]:
@@ -154,25 +451,13 @@ class VectorStoreManager:
                 )
             else:
                 results = self.vectorstore.similarity_search(query, k=k)
-
-            # 格式化结果
-            formatted_results = []
-            for doc in results:
-                formatted_results.append(
-                    {
-                        "pr_number": doc.metadata.get("pr_number"),
-                        "pr_title": doc.metadata.get("pr_title"),
-                        "content": doc.page_content,
-                        "metadata": doc.metadata,
-                    }
-                )
-
-            return formatted_results
-
         except Exception as e:
             logger.error(f"搜索失败: {e}")
             return []
 
+        # 格式化结果
+        return [self._format_search_result(doc) for doc in results]
+
     def search_with_score(
         self, query: str, k: int = 5, filter_dict: Optional[Dict] = None
     ) -> List[tuple]:
@@ -201,6 +486,65 @@ class VectorStoreManager:
             logger.error(f"搜索失败: {e}")
             return []
 
+    def search_with_score_batch(
+        self, queries: List[str], k: int = 5, filter_dict: Optional[Dict] = None
+    ) -> List[List[tuple]]:
+        """
+        批量带相似度分数的搜索，所有查询一次向量化、一次查询集合
+
+        Args:
+            queries: 搜索查询列表
+            k: 每个查询返回最相似的k个结果
+            filter_dict: 元数据过滤条件
+
+        Returns:
+            与 queries 一一对应的 (Document, score) 元组列表
+        """
+        if not queries:
+            return []
+
+        try:
+            embeddings = self.embeddings.embed_documents(list(queries))
+            results = self.vectorstore._collection.query(
+                query_embeddings=embeddings,
+                n_results=k,
+                where=filter_dict or None,
+                include=["documents", "metadatas", "distances"],
+            )
+
+            return [
+                [
+                    (Document(page_content=content, metadata=metadata or {}), score)
+                    for content, metadata, score in zip(documents, metadatas, distances)
+                ]
+                for documents, metadatas, distances in zip(
+                    results["documents"], results["metadatas"], results["distances"]
+                )
+            ]
+
+        except Exception as e:
+            logger.error(f"批量搜索失败: {e}")
+            return [[] for _ in queries]
+
+    def search_similar_prs_batch(
+        self, queries: List[str], k: int = 5, filter_dict: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        批量语义搜索相似的PR分析，所有查询一次向量化、一次查询集合
+
+        Args:
+            queries: 搜索查询列表
+            k: 每个查询返回最相似的k个结果
+            filter_dict: 元数据过滤条件
+
+        Returns:
+            与 queries 一一对应的相似PR列表，格式同 search_similar_prs
+        """
+        return [
+            [self._format_search_result(doc) for doc, _ in results]
+            for results in self.search_with_score_batch(queries, k, filter_dict)
+        ]
+
     def get_pr_by_number(self, pr_number: int) -> Optional[Dict]:
         """
         根据PR编号获取分析结果
@@ -214,33 +558,32 @@ class VectorStoreManager:
         try:
             # 查询指定pr_number的所有文档
             results = self.vectorstore.get(where={"pr_number": pr_number})
+        except Exception as e:
+            logger.error(f"获取PR #{pr_number}失败: {e}")
+            return None
 
-            if not results or not results.get("ids"):
-                return None
-
-            # 合并所有chunks的内容
-            documents = results.get("documents", [])
-            metadatas = results.get("metadatas", [])
+        if not results or not results.get("ids"):
+            return None
 
-            if not documents:
-                return None
+        # 合并所有chunks的内容
+        documents = results.get("documents", [])
+        metadatas = results.get("metadatas", [])
 
-            # 组合完整内容
-            full_content = "\n".join(documents)
+        if not documents:
+            return None
 
-            # 使用第一个文档的元数据作为基础
-            metadata = metadatas[0] if metadatas else {}
+        # 组合完整内容
+        full_content = "\n".join(documents)
 
-            return {
-                "pr_number": pr_number,
-                "pr_title": metadata.get("pr_title", ""),
-                "content": full_content,
-                "metadata": metadata,
-            }
+        # 使用第一个文档的元数据作为基础
+        metadata = (metadatas[0] if metadatas else None) or {}
 
-        except Exception as e:
-            logger.error(f"获取PR #{pr_number}失败: {e}")
-            return None
+        return {
+            "pr_number": pr_number,
+            "pr_title": metadata.get("pr_title", ""),
+            "content": full_content,
+            "metadata": metadata,
+        }
 
     def delete_pr_analysis(self, pr_number: int) -> bool:
         """